@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from aiohttp import web
+
+# Локальный сервер, который изображает API Wildberries для замеров производительности:
+#   GET /cards/v2/detail?nm=1;2;3 - информация о товарах (как WB_API_URL);
+#   GET /feedbacks/v2/<артикул>    - отзывы о товаре (как WB_REVIEWS_API_URL_BASE).
+# Ответы синтетические, но повторяемые: отзывы товара зависят только от артикула и seed.
+
+CARDS_PATH = "/cards/v2/detail"
+FEEDBACKS_PATH = "/feedbacks/v2/"
+
+
+# Настройки поддельного сервера.
+@dataclass
+class FakeServerOptions:
+    reviews_per_product: int = 200 # Сколько отзывов отдается на каждый товар.
+    text_size: int = 300 # Длина текста одного отзыва, символов.
+    review_days: float = 2.0 # За сколько последних дней "написаны" отзывы.
+    latency_ms: float = 50.0 # Задержка перед каждым ответом.
+    jitter_ms: float = 20.0 # Случайная добавка к задержке (от 0 до jitter_ms).
+    error_rate: float = 0.0 # Доля ответов 500.
+    throttle_rate: float = 0.0 # Доля ответов 429 (Too Many Requests).
+    retry_after: int = 1 # Значение заголовка Retry-After в ответах 429.
+    rate_limit: float = 0.0 # Сколько запросов в секунду сервер принимает, сверх этого отвечает 429 (0 - без ограничения).
+    seed: int = 1
+
+
+# Поддельный API: генерирует ответы и считает, сколько запросов и ошибок было отдано.
+class FakeWildberries:
+    def __init__(self, options: FakeServerOptions):
+        self.options = options
+        self._random = random.Random(options.seed)
+        self._feedbacks: dict[str, bytes] = {} # артикул -> готовое тело ответа с отзывами
+        self._now = datetime.utcnow().replace(microsecond=0)
+        self.stats = {"cards": 0, "feedbacks": 0, "errors": 0, "throttled": 0, "bytes": 0}
+        self._tokens = options.rate_limit # Ведро с жетонами для rate_limit (допускается всплеск в 1 секунду).
+        self._tokens_updated = time.monotonic()
+
+    # Тело ответа с отзывами: от новых к старым, как у настоящего API.
+    def _feedbacks_body(self, article: str) -> bytes:
+        body = self._feedbacks.get(article)
+        if body is None:
+            options = self.options
+            rnd = random.Random(f"{options.seed}:{article}")
+            step = timedelta(days=options.review_days) / max(options.reviews_per_product, 1)
+            feedbacks = []
+            for i in range(options.reviews_per_product):
+                rating = rnd.choices([1, 2, 3, 4, 5], weights=[1, 1, 1, 3, 10])[0]
+                feedbacks.append({
+                    "id": f"{article}-{options.reviews_per_product - i}",
+                    "createdDate": (self._now - step * i).isoformat(),
+                    "productValuation": rating,
+                    "text": "".join(rnd.choices("абвгдежзиклмнопрстуфхцчшэюя ", k=options.text_size)),
+                    "pros": "", "cons": "",
+                    "wbUserDetails": {"name": f"Покупатель {rnd.randint(1, 10**6)}"},
+                    "votes": {"pluses": rnd.randint(0, 50), "minuses": rnd.randint(0, 5)},
+                })
+            payload = {"feedbackCount": len(feedbacks), "valuation": "4.5", "feedbacks": feedbacks}
+            body = self._feedbacks[article] = json.dumps(payload, ensure_ascii=False).encode()
+        return body
+
+    # Превышен ли лимит запросов в секунду (как у настоящего API, который отвечает 429, если запросов слишком много).
+    def _over_rate_limit(self) -> bool:
+        rate = self.options.rate_limit
+        if not rate:
+            return False
+        now = time.monotonic()
+        self._tokens = min(rate, self._tokens + (now - self._tokens_updated) * rate)
+        self._tokens_updated = now
+        if self._tokens < 1:
+            return True
+        self._tokens -= 1
+        return False
+
+    # Задержка и случайные ошибки, общие для обоих адресов. Возвращает ответ-ошибку или None.
+    async def _simulate_network(self) -> web.Response | None:
+        options = self.options
+        if self._over_rate_limit():
+            self.stats["throttled"] += 1
+            return web.Response(status=429, headers={"Retry-After": str(options.retry_after)})
+        await asyncio.sleep((options.latency_ms + self._random.uniform(0, options.jitter_ms)) / 1000)
+        roll = self._random.random()
+        if roll < options.throttle_rate:
+            self.stats["throttled"] += 1
+            return web.Response(status=429, headers={"Retry-After": str(options.retry_after)})
+        if roll < options.throttle_rate + options.error_rate:
+            self.stats["errors"] += 1
+            return web.Response(status=500, text="Internal Server Error")
+        return None
+
+    async def cards(self, request: web.Request) -> web.Response:
+        self.stats["cards"] += 1
+        error = await self._simulate_network()
+        if error is not None:
+            return error
+        articles = [article for article in request.query.get("nm", "").split(";") if article.isdigit()]
+        products = [
+            {"id": int(article), "name": f"Тестовый товар {article}", "brand": "Бенчмарк"}
+            for article in articles
+        ]
+        body = json.dumps({"state": 0, "data": {"products": products}}, ensure_ascii=False).encode()
+        self.stats["bytes"] += len(body)
+        return web.Response(body=body, content_type="application/json")
+
+    async def feedbacks(self, request: web.Request) -> web.Response:
+        self.stats["feedbacks"] += 1
+        error = await self._simulate_network()
+        if error is not None:
+            return error
+        body = self._feedbacks_body(request.match_info["article"])
+        self.stats["bytes"] += len(body)
+        return web.Response(body=body, content_type="application/json")
+
+    async def stats_handler(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(CARDS_PATH, self.cards)
+        app.router.add_get(FEEDBACKS_PATH + "{article}", self.feedbacks)
+        app.router.add_get("/stats", self.stats_handler)
+        return app
+
+
+# Запускает сервер на 127.0.0.1 и возвращает runner (для остановки) и выбранный порт.
+async def start_server(options: FakeServerOptions, port: int = 0) -> tuple[web.AppRunner, int]:
+    runner = web.AppRunner(FakeWildberries(options).make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+
+# Точка входа отдельного процесса с сервером: сообщает порт через очередь и работает, пока процесс не остановят.
+# Сервер живет в своем процессе, чтобы его работа не смешивалась с замерами бота (время, память).
+def serve_forever(options: FakeServerOptions, port_queue):
+    async def run():
+        runner, port = await start_server(options)
+        port_queue.put(port)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поддельный API Wildberries для замеров производительности.")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--reviews", type=int, default=FakeServerOptions.reviews_per_product)
+    parser.add_argument("--text-size", type=int, default=FakeServerOptions.text_size)
+    parser.add_argument("--latency-ms", type=float, default=FakeServerOptions.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=FakeServerOptions.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=FakeServerOptions.error_rate)
+    parser.add_argument("--throttle-rate", type=float, default=FakeServerOptions.throttle_rate)
+    parser.add_argument("--rate-limit", type=float, default=FakeServerOptions.rate_limit)
+    args = parser.parse_args()
+    options = FakeServerOptions(
+        reviews_per_product=args.reviews, text_size=args.text_size, latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+        rate_limit=args.rate_limit,
+    )
+    web.run_app(FakeWildberries(options).make_app(), host="127.0.0.1", port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from benchmarks.fake_wb import CARDS_PATH, FEEDBACKS_PATH, FakeServerOptions, serve_forever
+
+# Замеры производительности бота на локальном поддельном API Wildberries (см. fake_wb.py).
+# Запуск из корня проекта:
+#   python -m benchmarks.run --products 500 --reviews 200 --latency-ms 50
+# Этапы:
+#   product_info - get_product_info для каждого артикула (кэш перед этапом очищается);
+#   reviews      - get_product_reviews для каждого артикула;
+#   cycle_cold   - полный проход планировщика (run_check_cycle) по пустой временной базе SQLite;
+#   cycle_warm   - повторный проход, когда все отзывы уже сохранены.
+# Результаты можно сохранить (--save) и сравнить со старыми (--compare), чтобы заметить ухудшение до выкладки.
+
+
+# Перцентиль p (от 0 до 100) по списку значений.
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+# Сбрасывает пиковую память процесса, чтобы следующий peak_rss_mb() показал пик только этого этапа.
+# Работает в Linux (запись "5" в /proc/self/clear_refs); в других системах возвращает False, и пик считается
+# за все время работы процесса. tracemalloc не используем: он замедляет этапы в 2-4 раза и искажает
+# остальные замеры того же запуска.
+def reset_peak_rss() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# Пиковая память процесса, МБ: с последнего reset_peak_rss() (Linux, VmHWM) или за все время работы
+# (ru_maxrss: в Linux - в КБ, в macOS - в байтах).
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+# Считает запросы к базе данных, которые что-то записывают, и завершенные транзакции.
+class DbWriteCounter:
+    def __init__(self, engine):
+        self.statements = 0 # Выполненных INSERT/UPDATE/DELETE (пачка из многих строк - один запрос).
+        self.commits = 0
+        from sqlalchemy import event
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine.sync_engine, "commit", self._commit)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+            self.statements += 1
+
+    def _commit(self, conn):
+        self.commits += 1
+
+    def snapshot(self) -> dict:
+        return {"statements": self.statements, "commits": self.commits}
+
+
+# Выполняет call(article) для всех артикулов, не больше concurrency одновременно, и замеряет каждый вызов.
+async def _timed_calls(call, articles: list[str], concurrency: int) -> tuple[float, list[float], list]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed(article):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await call(article)
+            latencies.append(time.perf_counter() - started)
+            return result
+
+    reset_peak_rss()
+    started = time.perf_counter()
+    results = await asyncio.gather(*(timed(article) for article in articles), return_exceptions=True)
+    return time.perf_counter() - started, latencies, results
+
+
+def _stage(name: str, products: int, elapsed: float, latencies: list[float] | None = None, **extra) -> dict:
+    stage = {
+        "stage": name,
+        "products": products,
+        "seconds": round(elapsed, 3),
+        "products_per_second": round(products / elapsed, 1) if elapsed else 0.0,
+    }
+    if latencies is not None:
+        stage["p50_ms"] = round(percentile(latencies, 50) * 1000, 1)
+        stage["p99_ms"] = round(percentile(latencies, 99) * 1000, 1)
+    stage.update(extra)
+    stage["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return stage
+
+
+async def _server_stats(session, base_url: str) -> dict:
+    async with session.get(f"{base_url}/stats") as response:
+        return await response.json()
+
+
+async def run_benchmarks(args, base_url: str) -> list[dict]:
+    # Модули бота импортируются здесь, после того как DATABASE_URL указывает на временную базу.
+    import wildberries_api
+    from sqlalchemy import insert
+    from database import engine, init_db, SessionLocal
+    from models import Product
+    import scheduler
+    from scheduler import load_products
+    from config import INITIAL_LOOKBACK_DAYS
+
+    wildberries_api.WB_API_URL = f"{base_url}{CARDS_PATH}?appType=1&curr=rub&nm="
+    wildberries_api.WB_REVIEWS_API_URL_BASE = f"{base_url}{FEEDBACKS_PATH}"
+    articles = [str(100000 + i) for i in range(args.products)]
+    writes = DbWriteCounter(engine)
+    stages = []
+
+    session = wildberries_api.create_http_session()
+    try:
+        wildberries_api._product_cache.clear()
+        elapsed, latencies, results = await _timed_calls(
+            lambda article: wildberries_api.get_product_info(article, session=session), articles, args.concurrency)
+        stages.append(_stage("product_info", len(articles), elapsed, latencies,
+                             found=sum(1 for result in results if result)))
+
+        since = datetime.utcnow() - timedelta(days=INITIAL_LOOKBACK_DAYS)
+        elapsed, latencies, results = await _timed_calls(
+            lambda article: wildberries_api.get_product_reviews(article, since=since, session=session),
+            articles, args.concurrency)
+        stages.append(_stage("reviews", len(articles), elapsed, latencies,
+                             reviews=sum(len(result) for result in results if isinstance(result, list)),
+                             failed=sum(1 for result in results if isinstance(result, Exception))))
+
+        # init_db и итоги прохода планировщика печатаются в stdout - в отчет замеров они не попадают.
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            await init_db()
+            async with SessionLocal() as db:
+                await db.execute(insert(Product), [{"article": a, "name": f"Товар {a}"} for a in articles])
+                await db.commit()
+
+            # Задержка товара в проходе планировщика - от начала запроса его отзывов до сохранения в базу.
+            fetch_started = {}
+            fetch_product_reviews = scheduler.fetch_product_reviews
+
+            async def timed_fetch(product, session):
+                fetch_started[product.id] = time.perf_counter()
+                return await fetch_product_reviews(product, session)
+
+            def on_result(product, reviews, new_reviews):
+                latencies.append(time.perf_counter() - fetch_started.pop(product.id))
+
+            scheduler.fetch_product_reviews = timed_fetch
+            for name in ("cycle_cold", "cycle_warm"):
+                products = await load_products()
+                before = writes.snapshot()
+                latencies = []
+                reset_peak_rss()
+                started = time.perf_counter()
+                inserted = await scheduler.run_check_cycle(products, session, concurrency=args.concurrency,
+                                                           on_result=on_result)
+                elapsed = time.perf_counter() - started
+                after = writes.snapshot()
+                stages.append(_stage(name, len(products), elapsed, latencies, inserted_reviews=inserted,
+                                     **{f"db_{key}": after[key] - before[key] for key in after}))
+
+        stages.append({"stage": "server", **await _server_stats(session, base_url)})
+    finally:
+        await session.close()
+        await engine.dispose()
+    return stages
+
+
+def print_report(stages: list[dict]):
+    for stage in stages:
+        name = stage["stage"]
+        details = ", ".join(f"{key}={value}" for key, value in stage.items() if key != "stage")
+        print(f"{name:<13} {details}")
+
+
+# Сравнивает результаты с сохраненными ранее и возвращает список ухудшений больше tolerance (доля).
+def compare(stages: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    old_stages = {stage["stage"]: stage for stage in baseline}
+    regressions = []
+    if old_stages.get("params") != next((stage for stage in stages if stage["stage"] == "params"), None):
+        regressions.append("параметры замера отличаются - сравнение некорректно")
+    for stage in stages:
+        old = old_stages.get(stage["stage"])
+        if not old:
+            continue
+        for key, higher_is_better in (("products_per_second", True), ("p99_ms", False), ("peak_rss_mb", False),
+                                      ("db_statements", False)):
+            if key not in stage or not old.get(key):
+                continue
+            change = (stage[key] - old[key]) / old[key]
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{stage['stage']}.{key}: {old[key]} -> {stage[key]} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности на поддельном API Wildberries.")
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--reviews", type=int, default=FakeServerOptions.reviews_per_product,
+                        help="отзывов на товар")
+    parser.add_argument("--text-size", type=int, default=FakeServerOptions.text_size)
+    parser.add_argument("--latency-ms", type=float, default=FakeServerOptions.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=FakeServerOptions.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=FakeServerOptions.error_rate)
+    parser.add_argument("--throttle-rate", type=float, default=FakeServerOptions.throttle_rate)
+    parser.add_argument("--rate-limit", type=float, default=FakeServerOptions.rate_limit,
+                        help="запросов в секунду, сверх которых сервер отвечает 429")
+    parser.add_argument("--concurrency", type=int, default=None, help="по умолчанию FETCH_CONCURRENCY")
+    parser.add_argument("--client-rate", type=float, default=1000,
+                        help="WB_HOST_RATE бота на время замеров, запросов в секунду; по умолчанию настолько высокий, "
+                             "чтобы замерялся код, а не ограничитель скорости")
+    parser.add_argument("--save", help="сохранить результаты в JSON-файл")
+    parser.add_argument("--compare", help="сравнить с результатами из JSON-файла")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение при сравнении (доля)")
+    args = parser.parse_args()
+
+    # Временная база данных и ограничение скорости задаются до импорта модулей бота, они читают настройки при импорте.
+    temp_dir = tempfile.mkdtemp(prefix="wb_bench_")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(temp_dir, 'bench.db')}"
+    os.environ["WB_HOST_RATE"] = str(args.client_rate)
+    if args.concurrency is None:
+        from config import FETCH_CONCURRENCY
+        args.concurrency = FETCH_CONCURRENCY
+
+    import logging
+    logging.disable(logging.ERROR) # Ошибки запросов подсчитывает сервер, построчный вывод только мешает замерам.
+
+    options = FakeServerOptions(
+        reviews_per_product=args.reviews, text_size=args.text_size, latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+        rate_limit=args.rate_limit,
+    )
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    server = context.Process(target=serve_forever, args=(options, port_queue), daemon=True)
+    server.start()
+    try:
+        base_url = f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+        # Пик памяти по этапам можно сравнивать только с таким же способом замера.
+        params = {"products": args.products, "concurrency": args.concurrency, "client_rate": args.client_rate,
+                  "peak_rss_per_stage": reset_peak_rss(), **vars(options)}
+        stages = [{"stage": "params", **params}] + asyncio.run(run_benchmarks(args, base_url))
+    finally:
+        server.terminate()
+        server.join()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print_report(stages)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(stages, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(stages, json.load(f), args.tolerance)
+        if regressions:
+            print("Ухудшения по сравнению с " + args.compare + ":")
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print("Ухудшений нет.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import time
+from collections import OrderedDict
+
+# Специальное значение "в кэше ничего нет" (None в кэше - тоже допустимое значение).
+MISSING = object()
+
+
+# Простой кэш в памяти процесса с ограниченным размером и временем жизни записей.
+# Когда кэш заполнен, вытесняется запись, к которой дольше всего не обращались (LRU).
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: OrderedDict = OrderedDict() # ключ -> (время истечения, значение)
+
+    def __len__(self):
+        return len(self._items)
+
+    # Возвращает значение или MISSING, если записи нет или она устарела.
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return MISSING
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            return MISSING
+        self._items.move_to_end(key) # Запись снова "свежая" для LRU.
+        return value
+
+    # Сохраняет значение. ttl можно указать отдельно для записи (например, короче для "не найдено").
+    def set(self, key, value, ttl: float | None = None):
+        self._items[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
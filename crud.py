@@ -0,0 +1,299 @@
+from datetime import date, datetime, timezone
+from sqlalchemy import case, delete, func, insert, literal, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Product, Review, ReviewArchive, ReviewDailyStat, Subscription
+from config import NEGATIVE_MAX_RATING
+
+# Сколько значений отправляем в одном запросе IN (...) или INSERT.
+# SQLite ограничивает количество параметров в одном запросе, поэтому большие списки делим на части.
+BATCH_SIZE = 500
+
+
+# Делит список на части не длиннее size.
+def chunked(items: list, size: int = BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# Приводит дату к UTC без часового пояса - в таком виде даты хранятся в базе данных.
+def to_naive_utc(value: datetime | None) -> datetime | None:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# Возвращает INSERT для текущей базы данных, поддерживающий ON CONFLICT (у SQLite и PostgreSQL он свой).
+def dialect_insert(db: AsyncSession, table):
+    if db.bind.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+# Возвращает INSERT, который пропускает строки с уже существующим уникальным ключом
+# (INSERT ... ON CONFLICT DO NOTHING).
+def insert_ignore(db: AsyncSession, table, index_elements: list[str]):
+    return dialect_insert(db, table).on_conflict_do_nothing(index_elements=index_elements)
+
+
+# Находит, какие из переданных внешних ID отзывов уже есть в базе данных.
+# Вместо отдельного запроса на каждый отзыв делаем один запрос IN (...) на каждую пачку.
+async def find_existing_review_ids(db: AsyncSession, external_ids: list[str]) -> set[str]:
+    existing = set()
+    for batch in chunked(external_ids):
+        result = await db.execute(select(Review.external_id).where(Review.external_id.in_(batch)))
+        existing.update(result.scalars())
+    return existing
+
+
+# Сохраняет отзывы одного товара пачками и возвращает только те, которые действительно были добавлены.
+# Негативные отзывы попадают в очередь уведомлений (is_notified = False), остальные - нет.
+# Функция не делает commit: вызывающий код сам решает, где заканчивается транзакция.
+async def save_new_reviews(db: AsyncSession, product_id: int, reviews: list[dict]) -> list[dict]:
+    # Убираем повторы внутри самого ответа API и отзывы без оценки (в таблице оценка обязательна).
+    by_external_id = {
+        str(review['external_id']): review
+        for review in reviews
+        if review.get('external_id') and review.get('rating') is not None
+    }
+    existing = await find_existing_review_ids(db, list(by_external_id))
+    rows = [
+        {
+            "product_id": product_id,
+            "external_id": external_id,
+            "rating": review['rating'],
+            "text": review['text'],
+            "author": review['author'],
+            "review_date": to_naive_utc(review['review_date']),
+            "is_notified": review['rating'] > NEGATIVE_MAX_RATING,
+        }
+        for external_id, review in by_external_id.items()
+        if external_id not in existing
+    ]
+
+    inserted_ids = set()
+    for batch in chunked(rows):
+        # ON CONFLICT DO NOTHING защищает от гонки, если тот же отзыв успел записать кто-то другой,
+        # а RETURNING сообщает, какие строки реально вставлены.
+        statement = insert_ignore(db, Review.__table__, ["external_id"]).returning(Review.external_id)
+        inserted_ids.update((await db.execute(statement, batch)).scalars())
+
+    return [by_external_id[external_id] for external_id in by_external_id if external_id in inserted_ids]
+
+
+# Помечает отзывы (по их id в базе данных) как уведомленные одним запросом на пачку.
+async def mark_reviews_notified(db: AsyncSession, review_ids: list[int]):
+    for batch in chunked(review_ids):
+        await db.execute(update(Review).where(Review.id.in_(batch)).values(is_notified=True, last_error=None))
+
+
+# Записывает неудачную попытку отправить уведомление об отзывах.
+async def record_notification_failure(db: AsyncSession, review_ids: list[int], error: str):
+    for batch in chunked(review_ids):
+        await db.execute(
+            update(Review)
+            .where(Review.id.in_(batch))
+            .values(notify_attempts=Review.notify_attempts + 1, last_error=error[:500])
+        )
+
+
+# Возвращает отзывы из очереди уведомлений вместе с товаром, от старых к новым.
+# exclude_ids - отзывы, уведомления о которых уже отправляются (их не нужно брать повторно);
+# exclude_chat_ids - чаты, которым пока хватает сообщений: отзывы товаров, на которые они подписаны, не берем.
+# Если exclude_unsubscribed, не берем и отзывы товаров без подписчиков (их получает общий чат NOTIFY_CHAT_ID).
+async def get_pending_notifications(db: AsyncSession, limit: int, max_attempts: int, exclude_ids=(),
+                                    exclude_chat_ids=(), exclude_unsubscribed: bool = False) -> list[tuple[Review, Product]]:
+    statement = (
+        select(Review, Product)
+        .join(Product, Review.product_id == Product.id)
+        .where(Review.is_notified.is_(False), Review.notify_attempts < max_attempts)
+        .order_by(Review.id)
+        .limit(limit)
+    )
+    if exclude_ids:
+        statement = statement.where(Review.id.not_in(list(exclude_ids)))
+    if exclude_chat_ids:
+        statement = statement.where(Review.product_id.not_in(
+            select(Subscription.product_id).where(Subscription.chat_id.in_(list(exclude_chat_ids)))))
+    if exclude_unsubscribed:
+        statement = statement.where(Review.product_id.in_(select(Subscription.product_id)))
+    result = await db.execute(statement)
+    return list(result.tuples())
+
+
+# Возвращает самый новый отзыв из списка (отзывы без даты не учитываются) или None.
+def newest_review(reviews: list[dict]) -> dict | None:
+    dated_reviews = [review for review in reviews if review['review_date'] > datetime.min.replace(tzinfo=timezone.utc)]
+    return max(dated_reviews, key=lambda review: review['review_date']) if dated_reviews else None
+
+
+# Передвигает "отметку" товара на самый новый из полученных отзывов.
+# Вызывается в той же транзакции, что и запись отзывов, поэтому отметка и отзывы сохраняются вместе.
+async def advance_product_watermark(db: AsyncSession, product_id: int, reviews: list[dict]):
+    values = {"last_checked": datetime.utcnow()}
+    newest = newest_review(reviews)
+    if newest is not None:
+        values["last_review_date"] = to_naive_utc(newest['review_date'])
+        values["last_review_id"] = str(newest['external_id'])
+    await db.execute(update(Product).where(Product.id == product_id).values(**values))
+
+
+# Обновляет названия нескольких товаров одним запросом (product_id -> новое название).
+async def update_product_names(db: AsyncSession, names: dict[int, str]):
+    if names:
+        await db.execute(update(Product), [{"id": product_id, "name": name} for product_id, name in names.items()])
+
+
+# Возвращает подписчиков товаров: product_id -> список chat_id (одним запросом на пачку товаров).
+async def get_subscribers(db: AsyncSession, product_ids: list[int]) -> dict[int, list[int]]:
+    subscribers: dict[int, list[int]] = {}
+    for batch in chunked(list(product_ids)):
+        result = await db.execute(
+            select(Subscription.product_id, Subscription.chat_id).where(Subscription.product_id.in_(batch))
+        )
+        for product_id, chat_id in result:
+            subscribers.setdefault(product_id, []).append(chat_id)
+    return subscribers
+
+
+# Сколько чатов подписано на товар.
+async def count_subscribers(db: AsyncSession, product_id: int) -> int:
+    return (await db.execute(
+        select(func.count()).select_from(Subscription).where(Subscription.product_id == product_id)
+    )).scalar_one()
+
+
+# Возвращает id уже отслеживаемых товаров: артикул -> id.
+async def find_products_by_articles(db: AsyncSession, articles: list[str]) -> dict[str, int]:
+    found = {}
+    for batch in chunked(articles):
+        rows = await db.execute(select(Product.article, Product.id).where(Product.article.in_(batch)))
+        found.update({article: product_id for article, product_id in rows})
+    return found
+
+
+# Массово добавляет товары (артикул -> название) и подписывает на них чат chat_id.
+# Уже существующие товары и подписки пропускаются. Возвращает, сколько добавлено новых подписок.
+# Функция не делает commit.
+async def add_products_with_subscriptions(db: AsyncSession, chat_id: int, products: dict[str, str]) -> int:
+    articles = list(products)
+    for batch in chunked(articles):
+        await db.execute(
+            insert_ignore(db, Product.__table__, ["article"]),
+            [{"article": article, "name": products[article]} for article in batch],
+        )
+    product_ids = list((await find_products_by_articles(db, articles)).values())
+    added = 0
+    for batch in chunked(product_ids):
+        result = await db.execute(
+            insert_ignore(db, Subscription.__table__, ["chat_id", "product_id"])
+            .returning(Subscription.__table__.c.id),
+            [{"chat_id": chat_id, "product_id": product_id} for product_id in batch],
+        )
+        added += len(result.all())
+    return added
+
+
+# Удаляет товар вместе с его отзывами, сводкой по дням и подписками.
+# Удаляем отдельными запросами, а не через каскад ORM, чтобы не загружать в память все отзывы товара.
+async def delete_product(db: AsyncSession, product_id: int):
+    await db.execute(delete(Review).where(Review.product_id == product_id))
+    await db.execute(delete(ReviewArchive).where(ReviewArchive.product_id == product_id))
+    await db.execute(delete(ReviewDailyStat).where(ReviewDailyStat.product_id == product_id))
+    await db.execute(delete(Subscription).where(Subscription.product_id == product_id))
+    await db.execute(delete(Product).where(Product.id == product_id))
+
+
+# Переносит до limit отзывов, написанных раньше cutoff, из таблицы reviews в архив (или просто удаляет,
+# если archive=False). Отзывы, которые еще ждут отправки уведомления, не трогаем.
+# Возвращает, сколько отзывов перенесено. Функция не делает commit.
+async def archive_reviews_before(db: AsyncSession, cutoff: datetime, limit: int, max_attempts: int,
+                                 archive: bool = True) -> int:
+    ids = list((await db.execute(
+        select(Review.id)
+        .where(Review.review_date < cutoff)
+        .where((Review.is_notified.is_(True)) | (Review.notify_attempts >= max_attempts))
+        .order_by(Review.id)
+        .limit(limit)
+    )).scalars())
+    if not ids:
+        return 0
+    for batch in chunked(ids):
+        if archive:
+            columns = [Review.id, Review.product_id, Review.external_id, Review.rating, Review.review_date]
+            rows = select(*columns, literal(datetime.utcnow()).label("archived_at")).where(Review.id.in_(batch))
+            await db.execute(
+                insert_ignore(db, ReviewArchive.__table__, ["id"]).from_select(
+                    ["id", "product_id", "external_id", "rating", "review_date", "archived_at"], rows)
+            )
+        await db.execute(delete(Review).where(Review.id.in_(batch)))
+    return len(ids)
+
+
+# Колонки сводки по дням для каждой оценки: оценка -> имя колонки в review_daily_stats.
+RATING_COLUMNS = {rating: f"rating_{rating}" for rating in range(1, 6)}
+
+
+# Добавляет новые отзывы товара в сводку по дням: для каждого дня один запрос
+# INSERT ... ON CONFLICT DO UPDATE SET rating_N = rating_N + excluded.rating_N.
+# Передавать нужно только действительно добавленные отзывы (см. save_new_reviews), иначе они посчитаются дважды.
+# Функция не делает commit.
+async def add_review_daily_stats(db: AsyncSession, product_id: int, reviews: list[dict]):
+    days = {}
+    for review in reviews:
+        column = RATING_COLUMNS.get(review['rating'])
+        if column is None or review.get('review_date') is None:
+            continue
+        counts = days.setdefault(to_naive_utc(review['review_date']).date(), dict.fromkeys(RATING_COLUMNS.values(), 0))
+        counts[column] += 1
+    if not days:
+        return
+    table = ReviewDailyStat.__table__
+    statement = dialect_insert(db, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["product_id", "day"],
+        set_={column: table.c[column] + statement.excluded[column] for column in RATING_COLUMNS.values()},
+    )
+    rows = [{"product_id": product_id, "day": day, **counts} for day, counts in days.items()]
+    for batch in chunked(rows):
+        await db.execute(statement, batch)
+
+
+# Заново собирает сводку по дням из всех отзывов (и из таблицы reviews, и из архива).
+# Нужна один раз, когда таблица сводки только что появилась в старой базе данных. Функция не делает commit.
+async def rebuild_review_daily_stats(db: AsyncSession):
+    reviews = union_all(
+        select(Review.product_id, Review.rating, Review.review_date),
+        select(ReviewArchive.product_id, ReviewArchive.rating, ReviewArchive.review_date),
+    ).subquery()
+    rows = (
+        select(
+            reviews.c.product_id,
+            func.date(reviews.c.review_date),
+            *(func.sum(case((reviews.c.rating == rating, 1), else_=0)) for rating in RATING_COLUMNS),
+        )
+        .where(reviews.c.product_id.is_not(None), reviews.c.review_date.is_not(None))
+        .group_by(reviews.c.product_id, func.date(reviews.c.review_date))
+    )
+    await db.execute(delete(ReviewDailyStat))
+    await db.execute(
+        insert(ReviewDailyStat).from_select(["product_id", "day", *RATING_COLUMNS.values()], rows)
+    )
+
+
+# Сколько отзывов с каждой оценкой пришло с start по end включительно (по сводке, без перебора отзывов).
+# Считает по одному товару (product_id) или по всем товарам, на которые подписан чат (chat_id).
+# Возвращает словарь оценка -> количество.
+async def sum_review_daily_stats(db: AsyncSession, start: date, end: date,
+                                 product_id: int | None = None, chat_id: int | None = None) -> dict[int, int]:
+    statement = (
+        select(*(func.coalesce(func.sum(getattr(ReviewDailyStat, column)), 0) for column in RATING_COLUMNS.values()))
+        .where(ReviewDailyStat.day >= start, ReviewDailyStat.day <= end)
+    )
+    if product_id is not None:
+        statement = statement.where(ReviewDailyStat.product_id == product_id)
+    else:
+        statement = statement.join(Subscription, Subscription.product_id == ReviewDailyStat.product_id).where(
+            Subscription.chat_id == chat_id)
+    counts = (await db.execute(statement)).one()
+    return dict(zip(RATING_COLUMNS, (int(count) for count in counts)))
@@ -1,27 +1,122 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from models import Base
+import hashlib
+from contextlib import asynccontextmanager
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from models import Base, Review, ReviewDailyStat, SchemaVersion
+from crud import rebuild_review_daily_stats
 from config import DATABASE_URL
 
-# Создаем "движок" для подключения к базе данных.
-engine = create_engine(DATABASE_URL, echo=False)
 
-# Создаем класс для создания "сессий".
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Приводим адрес базы данных к асинхронному драйверу, если в настройках указан обычный.
+def _async_database_url(url: str) -> str:
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+
+# Создаем асинхронный "движок" для подключения к базе данных.
+# Запросы через него не блокируют цикл событий, поэтому бот отвечает на команды,
+# даже пока планировщик записывает много отзывов.
+engine = create_async_engine(_async_database_url(DATABASE_URL), echo=False)
+
+if engine.dialect.name == "sqlite":
+    # Настраиваем SQLite при каждом новом подключении.
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # Освободившиеся после удаления отзывов страницы можно вернуть системе по частям (см. maintenance.py).
+        # Для новой базы действует сразу, старую переводит в этот режим первое обслуживание.
+        # Должно идти до journal_mode=WAL: переход в WAL создает файл базы, и после этого режим меняет только VACUUM.
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL") # Читатели не ждут писателя.
+        cursor.execute("PRAGMA synchronous=NORMAL") # В режиме WAL это безопасно и намного быстрее FULL.
+        cursor.execute("PRAGMA busy_timeout=5000") # Ждем до 5 секунд, если база занята другим подключением.
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-16000") # Кэш страниц около 16 МБ.
+        cursor.close()
+
+# Создаем класс для создания асинхронных "сессий".
+# expire_on_commit=False: после commit объекты можно читать без нового запроса к базе.
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# create_all не меняет уже существующие таблицы, поэтому новые колонки
+# добавляем в старую базу данных вручную.
+def _add_missing_columns(sync_conn):
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ""
+            print(f"Adding column {table.name}.{column.name} to the database...")
+            sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}"))
+
+
+# create_all не создает индексы для уже существующих таблиц, поэтому добавляем недостающие.
+def _add_missing_indexes(sync_conn):
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                print(f"Adding index {index.name} to the database...")
+                index.create(sync_conn)
+
+
+# "Отпечаток" схемы: хэш от CREATE TABLE и CREATE INDEX всех моделей. Меняется при любом изменении моделей.
+def schema_fingerprint(dialect) -> str:
+    ddl = []
+    for table in Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+        ddl.extend(str(CreateIndex(index).compile(dialect=dialect)) for index in sorted(table.indexes, key=lambda i: i.name))
+    return hashlib.sha256("\n".join(ddl).encode()).hexdigest()
+
+
+# Версия схемы, для которой уже подготовлена база данных (None - новая или старая база без таблицы версий).
+def _stored_schema_version(sync_conn) -> str | None:
+    if not inspect(sync_conn).has_table(SchemaVersion.__tablename__):
+        return None
+    return sync_conn.execute(select(SchemaVersion.version).where(SchemaVersion.id == 1)).scalar()
+
+
+def _store_schema_version(sync_conn, version: str):
+    table = SchemaVersion.__table__
+    if sync_conn.execute(table.update().where(table.c.id == 1).values(version=version)).rowcount == 0:
+        sync_conn.execute(table.insert().values(id=1, version=version))
+
 
 # Функция для создания всех таблиц в базе данных.
-def init_db():
-    print("Attempting to initialize database...")
-    Base.metadata.create_all(bind=engine)
+# Таблицы, колонки и индексы проверяются только если модели изменились с прошлого запуска
+# (или база новая) - обычный перезапуск бота обходится одним запросом.
+async def init_db():
+    version = schema_fingerprint(engine.dialect)
+    async with engine.begin() as conn:
+        if await conn.run_sync(_stored_schema_version) == version:
+            return
+        print(f"Initializing database {engine.url.render_as_string(hide_password=True)}...")
+        # Сводку по дням нужно собрать из уже накопленных отзывов, если она появилась в работающей базе.
+        tables = await conn.run_sync(lambda sync_conn: set(inspect(sync_conn).get_table_names()))
+        needs_daily_stats = Review.__tablename__ in tables and ReviewDailyStat.__tablename__ not in tables
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_add_missing_indexes)
+        if needs_daily_stats:
+            print("Building review daily stats from existing reviews...")
+            async with AsyncSession(bind=conn) as db:
+                await rebuild_review_daily_stats(db)
+        await conn.run_sync(_store_schema_version, version)
     print("Database initialized successfully.")
 
-from contextlib import asynccontextmanager
-
 # Это специальная функция для получения сессии базы данных.
 @asynccontextmanager
 async def get_db():
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
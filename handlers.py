@@ -1,17 +1,29 @@
+import asyncio
+import re
+import time
+from datetime import datetime, timedelta
+import aiohttp
 from aiogram import Router
 from aiogram.types import Message
 from aiogram.filters import Command
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from models import Product
+from models import Product, Subscription
 from database import get_db
-from wildberries_api import get_product_info
+from crud import (
+    count_subscribers, delete_product, find_products_by_articles, add_products_with_subscriptions,
+    sum_review_daily_stats,
+)
+from wildberries_api import get_product_info, get_products_info
+from config import (
+    PRODUCT_BATCH_SIZE, IMPORT_MAX_ARTICLES, IMPORT_MAX_FILE_BYTES, IMPORT_PROGRESS_SECONDS, NEGATIVE_MAX_RATING,
+)
 from typing import AsyncGenerator
 
 router = Router()
 
 # Эта функция помогает получать сессию базы данных.
-async def get_db_session() -> AsyncGenerator[Session, None]:
+async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
     async for session in get_db():
         yield session
 
@@ -35,15 +47,18 @@ async def command_help_handler(message: Message):
     await message.answer(
         "Доступные команды:\n"
         "/start - Приветствие\n"
-        "/article [артикул] - Добавить товар для мониторинга\n"
-        "/stop_monitoring [артикул] - Удалить товар из мониторинга\n"
+        "/article [артикул] - Добавить товар для мониторинга в этом чате\n"
+        "/import [артикулы] - Добавить сразу много товаров (можно прислать файл .txt или .csv с подписью /import)\n"
+        "/stop_monitoring [артикул] - Удалить товар из мониторинга в этом чате\n"
+        "/stats [артикул] [период] - Статистика отзывов за период (например, `/stats 12345678 7d`); "
+        "без артикула - по всем товарам этого чата\n"
         "/help - Справка по командам"
     )
 
 # Обработчик команды /article.
 # Добавляет товар для отслеживания негативных отзывов.
 @router.message(Command("article"))
-async def add_article_handler(message: Message):
+async def add_article_handler(message: Message, http_session: aiohttp.ClientSession):
     print(f"DEBUG_HANDLER: Получена команда /article от пользователя {message.from_user.id}: '{message.text}'")
     parts = message.text.split()
     if len(parts) < 2: # Если артикул не указан
@@ -60,43 +75,56 @@ async def add_article_handler(message: Message):
         try:
             print(f"DEBUG_HANDLER: Пытаемся найти артикул {article} в БД.")
             # Ищем товар в базе данных по артикулу.
-            existing_product = db.execute(select(Product).filter_by(article=article)).scalar_one_or_none()
+            existing_product = (await db.execute(select(Product).filter_by(article=article))).scalar_one_or_none()
 
             print(f"DEBUG_HANDLER: Результат поиска existing_product для артикула {article}: {existing_product}")
             print(f"DEBUG_HANDLER: Тип existing_product: {type(existing_product)}")
 
-            if existing_product: # Если товар уже отслеживается
+            chat_id = message.chat.id
+            if existing_product: # Если товар уже отслеживается (этим или другим чатом)
                 print(f"DEBUG_HANDLER: Товар с артикулом {article} уже найден в БД.")
-                await message.answer(f"Товар с артикулом {article} уже отслеживается.")
+                subscription = (await db.execute(
+                    select(Subscription).filter_by(chat_id=chat_id, product_id=existing_product.id)
+                )).scalar_one_or_none()
+                if subscription:
+                    await message.answer(f"Товар с артикулом {article} уже отслеживается.")
+                    return
+                # Отзывы товара уже запрашиваются - просто подписываем этот чат.
+                db.add(Subscription(chat_id=chat_id, product_id=existing_product.id))
+                await db.commit()
+                await message.answer(
+                    f"Товар '{existing_product.name}' (артикул: {existing_product.article}) добавлен для мониторинга."
+                )
                 return
 
             print(f"DEBUG_HANDLER: Товар {article} не найден в нашей БД, запрашиваем информацию у Wildberries API.")
             # Запрашиваем информацию о товаре у Wildberries.
-            product_info = await get_product_info(article)
+            product_info = await get_product_info(article, session=http_session)
 
             if not product_info: # Если Wildberries не дал информацию о товаре
                 print(f"DEBUG_HANDLER: Не удалось получить информацию о товаре {article} от Wildberries API.")
                 await message.answer(f"Не удалось найти информацию о товаре с артикулом {article}. Проверьте артикул.")
                 return
 
-            # Создаем новую запись о товаре и добавляем её в базу данных.
+            # Создаем новую запись о товаре и подписку этого чата и добавляем их в базу данных.
             new_product = Product(article=article, name=product_info.get('name', 'Неизвестное название'))
+            new_product.subscriptions.append(Subscription(chat_id=chat_id))
             db.add(new_product)
-            db.commit()
-            db.refresh(new_product) # Обновляем объект, чтобы получить ID из базы данных.
+            await db.commit()
+            await db.refresh(new_product) # Обновляем объект, чтобы получить ID из базы данных.
 
             print(f"DEBUG_HANDLER: Товар '{new_product.name}' (артикул: {new_product.article}) успешно добавлен в БД.")
             await message.answer(
                 f"Товар '{new_product.name}' (артикул: {new_product.article}) добавлен для мониторинга.\n"
-                "Я буду проверять новые негативные отзывы каждые 30 минут."
+                "Я буду регулярно проверять новые негативные отзывы: чем чаще у товара появляются отзывы, тем чаще проверка."
             )
         except Exception as e: # Если произошла какая-то ошибка
-            db.rollback() # Отменяем все изменения в базе данных.
+            await db.rollback() # Отменяем все изменения в базе данных.
             print(f"ERROR_HANDLER: Произошла ошибка при добавлении/проверке товара: {e}")
             await message.answer(f"Произошла ошибка при добавлении товара: {e}")
 
 # Обработчик команды /stop_monitoring.
-# Удаляет товар из списка отслеживаемых.
+# Отписывает чат от товара. Когда товар больше никто не отслеживает, он удаляется вместе с отзывами.
 @router.message(Command("stop_monitoring"))
 async def stop_monitoring_handler(message: Message):
     print(f"DEBUG_HANDLER: Получена команда /stop_monitoring от пользователя {message.from_user.id}: '{message.text}'")
@@ -110,17 +138,207 @@ async def stop_monitoring_handler(message: Message):
 
     async with get_db() as db: # Открываем сессию базы данных
         try:
-            # Ищем товар для удаления.
-            product_to_delete = db.execute(select(Product).filter_by(article=article)).scalar_one_or_none()
-            if product_to_delete: # Если товар найден
-                db.delete(product_to_delete) # Удаляем товар из сессии.
-                db.commit() # Сохраняем изменения (удаление) в базе данных.
-                print(f"DEBUG_HANDLER: Товар с артикулом {article} успешно удален из мониторинга.")
+            # Ищем товар и подписку этого чата на него.
+            product = (await db.execute(select(Product).filter_by(article=article))).scalar_one_or_none()
+            subscription = None
+            if product:
+                subscription = (await db.execute(
+                    select(Subscription).filter_by(chat_id=message.chat.id, product_id=product.id)
+                )).scalar_one_or_none()
+
+            # Товары, добавленные до появления подписок, ни на кого не подписаны - их может удалить любой чат.
+            if product and (subscription or await count_subscribers(db, product.id) == 0):
+                if subscription:
+                    await db.delete(subscription) # Удаляем подписку этого чата.
+                    await db.flush()
+                if await count_subscribers(db, product.id) == 0: # Больше никто не следит за товаром.
+                    await delete_product(db, product.id)
+                await db.commit() # Сохраняем изменения (удаление) в базе данных.
+                print(f"DEBUG_HANDLER: Чат {message.chat.id} отписан от товара с артикулом {article}.")
                 await message.answer(f"Мониторинг для товара с артикулом {article} остановлен.")
-            else: # Если товар не найден
+            else: # Если этот чат не следит за товаром
                 print(f"DEBUG_HANDLER: Товар с артикулом {article} не найден в списке мониторинга.")
                 await message.answer(f"Товар с артикулом {article} не найден в списке мониторинга.")
         except Exception as e: # Если произошла ошибка
-            db.rollback() # Отменяем изменения.
+            await db.rollback() # Отменяем изменения.
             print(f"ERROR_HANDLER: Произошла ошибка при удалении товара: {e}")
-            await message.answer(f"Произошла ошибка при удалении товара: {e}")
\ No newline at end of file
+            await message.answer(f"Произошла ошибка при удалении товара: {e}")
+
+# Достает артикулы из текста команды /import или из присланного файла.
+# В тексте команды артикулы разделяются пробелами, переводами строк, "," или ";" - берем каждое число.
+# В файле (document=True) строки с разделителями "," ";" или табуляцией считаем строками CSV и берем из них
+# только первое поле из одних цифр - остальные колонки (цена, количество) артикулами не считаем.
+def parse_articles(text: str, document: bool = False) -> list[str]:
+    articles = []
+    for line in text.splitlines():
+        if document and re.search(r"[,;\t]", line):
+            fields = [field.strip().strip('"') for field in re.split(r"[,;\t]", line)]
+            articles.extend([field for field in fields if field.isdigit()][:1])
+        else:
+            articles.extend(token for token in re.split(r"[\s,;]+", line) if token.isdigit())
+    return list(dict.fromkeys(articles)) # Убираем повторы, сохраняя порядок.
+
+
+# Обработчик команды /import.
+# Добавляет сразу много товаров: артикулы перечисляются после команды или присылаются файлом с подписью /import.
+# Уже отслеживаемые товары просто подписываются на этот чат, новые проверяются у Wildberries пачками
+# (параллельно) и добавляются в базу данных одной записью. Ход работы показывается в одном сообщении.
+@router.message(Command("import"))
+async def import_articles_handler(message: Message, http_session: aiohttp.ClientSession):
+    print(f"DEBUG_HANDLER: Получена команда /import от пользователя {message.from_user.id}")
+    if message.document:
+        if message.document.file_size and message.document.file_size > IMPORT_MAX_FILE_BYTES:
+            await message.answer(f"Файл слишком большой: можно не больше {IMPORT_MAX_FILE_BYTES // 1024} КБ.")
+            return
+        text = (await message.bot.download(message.document)).read().decode("utf-8-sig", errors="ignore")
+    else:
+        # Убираем саму команду (/import или /import@bot); артикулы могут идти через пробел, запятую или с новой строки.
+        text = "".join((message.text or "").split(maxsplit=1)[1:])
+
+    articles = parse_articles(text, document=bool(message.document))
+    if not articles:
+        await message.answer(
+            "Пожалуйста, укажите артикулы через пробел, запятую или с новой строки, например: `/import 12345678, 87654321`, "
+            "или пришлите файл .txt или .csv со списком артикулов и подписью /import."
+        )
+        return
+    if len(articles) > IMPORT_MAX_ARTICLES:
+        await message.answer(f"Слишком много артикулов ({len(articles)}): за раз можно добавить не больше {IMPORT_MAX_ARTICLES}.")
+        return
+
+    status = await message.answer(f"Получено артикулов: {len(articles)}. Проверяю...")
+    last_edit = time.monotonic()
+
+    # Обновляет сообщение о ходе работы, но не чаще раза в IMPORT_PROGRESS_SECONDS (у Telegram есть лимиты на правки).
+    async def show_progress(text: str, force: bool = False):
+        nonlocal last_edit
+        if not force and time.monotonic() - last_edit < IMPORT_PROGRESS_SECONDS:
+            return
+        last_edit = time.monotonic()
+        try:
+            await status.edit_text(text)
+        except Exception as e: # Например, текст не изменился - это не ошибка импорта.
+            print(f"DEBUG_HANDLER: Не удалось обновить сообщение о ходе импорта: {e}")
+
+    try:
+        async with get_db() as db:
+            existing = await find_products_by_articles(db, articles)
+        to_check = [article for article in articles if article not in existing]
+
+        # Новые артикулы проверяем у Wildberries пачками; пачки идут параллельно
+        # (общее ограничение на запросы к хосту соблюдается в wildberries_api).
+        found = {}
+        checked = 0
+        batches = [to_check[i:i + PRODUCT_BATCH_SIZE] for i in range(0, len(to_check), PRODUCT_BATCH_SIZE)]
+        for lookup in asyncio.as_completed([get_products_info(batch, session=http_session) for batch in batches]):
+            products = await lookup
+            checked += len(products)
+            found.update({article: info['name'] for article, info in products.items() if info})
+            await show_progress(f"Проверено новых артикулов: {checked} из {len(to_check)}, найдено: {len(found)}.")
+
+        names = {article: None for article in existing} # Названия уже отслеживаемых товаров не меняем.
+        names.update(found)
+        async with get_db() as db:
+            try:
+                subscribed = await add_products_with_subscriptions(db, message.chat.id, names)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+    except Exception as e:
+        print(f"ERROR_HANDLER: Произошла ошибка при импорте товаров: {e}")
+        await show_progress(f"Произошла ошибка при добавлении товаров: {e}", force=True)
+        return
+
+    not_found = [article for article in to_check if article not in found]
+    report = (
+        f"Готово. Артикулов в списке: {len(articles)}, добавлено для мониторинга: {subscribed}, "
+        f"уже отслеживались в этом чате: {len(names) - subscribed}, не найдено на Wildberries или не удалось проверить: {len(not_found)}."
+    )
+    if not_found:
+        report += "\nНе найдены: " + ", ".join(not_found[:50]) + (" и другие." if len(not_found) > 50 else "")
+    print(f"DEBUG_HANDLER: Импорт для чата {message.chat.id}: {report}")
+    await show_progress(report, force=True)
+
+# Период статистики по умолчанию и наибольший, в днях.
+STATS_DEFAULT_DAYS = 30
+STATS_MAX_DAYS = 3650
+
+
+# Разбирает период вида "7", "7d" или "7д" (в днях). Возвращает None, если это не период.
+def parse_period(value: str) -> int | None:
+    match = re.fullmatch(r"(\d+)\s*[dдDД]?", value)
+    if not match or not 1 <= int(match.group(1)) <= STATS_MAX_DAYS:
+        return None
+    return int(match.group(1))
+
+
+# Текст статистики за период (и изменение по сравнению с предыдущим таким же периодом).
+def format_review_stats(title: str, days: int, counts: dict[int, int], previous: dict[int, int]) -> str:
+    def summary(counts: dict[int, int]) -> tuple[int, float | None, float | None]:
+        total = sum(counts.values())
+        if not total:
+            return 0, None, None
+        average = sum(rating * count for rating, count in counts.items()) / total
+        negative = sum(count for rating, count in counts.items() if rating <= NEGATIVE_MAX_RATING) / total
+        return total, average, negative
+
+    total, average, negative = summary(counts)
+    previous_total, previous_average, previous_negative = summary(previous)
+    lines = [f"{title} за {days} дн.:", f"Отзывов: {total} (за предыдущие {days} дн.: {previous_total})"]
+    if total:
+        was = f" (было {previous_average:.2f})" if previous_total else ""
+        lines.append(f"Средняя оценка: {average:.2f}{was}")
+        was = f" (было {previous_negative:.1%})" if previous_total else ""
+        lines.append(f"Негативных (оценка {NEGATIVE_MAX_RATING} и ниже): {negative:.1%}{was}")
+        lines.append(", ".join(f"{rating}★: {counts[rating]}" for rating in sorted(counts, reverse=True)))
+    return "\n".join(lines)
+
+
+# Обработчик команды /stats.
+# Показывает, сколько отзывов с какой оценкой пришло за период: по одному товару или по всем товарам чата.
+# Считается по сводке review_daily_stats (одна строка на товар и день), а не по самим отзывам.
+@router.message(Command("stats"))
+async def stats_handler(message: Message):
+    print(f"DEBUG_HANDLER: Получена команда /stats от пользователя {message.from_user.id}: '{message.text}'")
+    args = message.text.split()[1:]
+    article, days = None, STATS_DEFAULT_DAYS
+    if len(args) == 2 or (len(args) == 1 and args[0].isdigit()): # Одно число без "d" - это артикул.
+        article = args[0]
+    if len(args) == 2 or (len(args) == 1 and article is None):
+        days = parse_period(args[-1])
+    if len(args) > 2 or days is None or (article is not None and not article.isdigit()):
+        await message.answer(
+            "Используйте `/stats [артикул] [период]`, например: `/stats 12345678 7d` или `/stats 30d`. "
+            f"Период указывается в днях (от 1 до {STATS_MAX_DAYS}), по умолчанию {STATS_DEFAULT_DAYS}."
+        )
+        return
+
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=days - 1)
+    previous_start, previous_end = start - timedelta(days=days), start - timedelta(days=1)
+    async with get_db() as db:
+        try:
+            if article is None:
+                title = "Все товары этого чата"
+                query = {"chat_id": message.chat.id}
+            else:
+                product = (await db.execute(select(Product).filter_by(article=article))).scalar_one_or_none()
+                subscription = None
+                if product:
+                    subscription = (await db.execute(
+                        select(Subscription).filter_by(chat_id=message.chat.id, product_id=product.id)
+                    )).scalar_one_or_none()
+                # Как и в /stop_monitoring: товары без подписок доступны любому чату.
+                if not product or not (subscription or await count_subscribers(db, product.id) == 0):
+                    await message.answer(f"Товар с артикулом {article} не найден в списке мониторинга.")
+                    return
+                title = f"Товар '{product.name}' (артикул: {product.article})"
+                query = {"product_id": product.id}
+            counts = await sum_review_daily_stats(db, start, end, **query)
+            previous = await sum_review_daily_stats(db, previous_start, previous_end, **query)
+        except Exception as e:
+            print(f"ERROR_HANDLER: Произошла ошибка при подсчете статистики: {e}")
+            await message.answer(f"Произошла ошибка при подсчете статистики: {e}")
+            return
+    await message.answer(format_review_stats(title, days, counts, previous))
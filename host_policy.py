@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from rate_limit import TokenBucket
+from config import (
+    WB_PER_HOST_LIMIT, WB_HOST_RATE, WB_HOST_MIN_RATE, WB_BACKOFF_BASE_SECONDS,
+    WB_BACKOFF_MAX_SECONDS, WB_BREAKER_FAILURES, WB_BREAKER_RESET_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Общие для всех запросов правила обращения к одному хосту:
+#   - не больше WB_PER_HOST_LIMIT запросов одновременно;
+#   - не больше WB_HOST_RATE запросов в секунду (ведро с жетонами). Если хост отвечает 429,
+#     скорость снижается вдвое, а после успешных ответов понемногу возвращается к WB_HOST_RATE;
+#   - повтор неудачных запросов с растущей паузой (с учетом заголовка Retry-After);
+#   - "предохранитель" (circuit breaker): после WB_BREAKER_FAILURES неудач подряд запросы к хосту
+#     не отправляются WB_BREAKER_RESET_SECONDS секунд, а потом пропускается один пробный запрос.
+
+# Ответы с такими кодами имеет смысл повторить: хост перегружен или просит подождать.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Хост временно недоступен: предохранитель разомкнут после череды неудач.
+class CircuitOpenError(Exception):
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Запросы к {host} приостановлены после ошибок, повтор через {retry_in:.0f} с")
+        self.host = host
+        self.retry_in = retry_in
+
+
+# Хост ответил кодом, который стоит повторить (429 или 5xx).
+class RetryableStatusError(Exception):
+    def __init__(self, status: int, retry_after: float | None):
+        super().__init__(f"Ответ {status}" + (f", Retry-After: {retry_after:.0f} с" if retry_after else ""))
+        self.status = status
+        self.retry_after = retry_after
+
+
+# Разбирает заголовок Retry-After: число секунд или дата. Возвращает секунды или None.
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+# Пауза перед повтором номер attempt (с нуля): экспоненциальный рост со случайным разбросом ("full jitter"),
+# чтобы повторы многих запросов не приходили на хост одновременно. Если хост сам указал,
+# сколько ждать (Retry-After), ждем не меньше.
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    delay = random.uniform(0, min(WB_BACKOFF_MAX_SECONDS, WB_BACKOFF_BASE_SECONDS * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+# Предохранитель для одного хоста.
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = WB_BREAKER_FAILURES, reset_seconds: float = WB_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0 # Неудач подряд.
+        self.opened_at: float | None = None # Когда предохранитель разомкнулся (None - замкнут, запросы идут).
+        self._probe_started: float | None = None # Когда ушел пробный запрос.
+
+    # Проверяет, можно ли отправить запрос. Если нельзя, выбрасывает CircuitOpenError.
+    def check(self, host: str):
+        if self.opened_at is None:
+            return
+        now = time.monotonic()
+        retry_in = self.opened_at + self.reset_seconds - now
+        if retry_in <= 0 and self._probe_started is not None:
+            # Пробный запрос уже идет. Если он так и не завершился (например, его отменили), через
+            # reset_seconds пропускаем следующий.
+            retry_in = self._probe_started + self.reset_seconds - now
+        if retry_in > 0:
+            raise CircuitOpenError(host, retry_in)
+        self._probe_started = now # Время вышло - пропускаем один пробный запрос.
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probe_started is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probe_started = None
+
+
+# Правила обращения к одному хосту (см. описание в начале файла).
+class HostPolicy:
+    def __init__(self, host: str, rate: float = WB_HOST_RATE, min_rate: float = WB_HOST_MIN_RATE,
+                 concurrency: int = WB_PER_HOST_LIMIT):
+        self.host = host
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.bucket = TokenBucket(rate)
+        self.breaker = CircuitBreaker()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._slowed_down_at = 0.0
+
+    # Ждет разрешения на запрос: предохранитель замкнут и в ведре есть жетон.
+    async def acquire(self):
+        self.breaker.check(self.host)
+        await self.bucket.acquire()
+
+    # Успешный ответ: сбрасываем счетчик неудач и понемногу возвращаем скорость к максимальной.
+    def record_success(self):
+        self.breaker.record_success()
+        if self.bucket.rate < self.max_rate:
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate / 20)
+
+    # Неудачный ответ (5xx, 429 или ошибка сети).
+    # 429 значит "слишком часто", а не "хост сломан": предохранитель он не размыкает, зато снижаем скорость.
+    # Несколько одновременных запросов получают 429 почти разом, поэтому скорость снижаем не чаще раза в секунду.
+    # Если хост указал Retry-After, ставим на паузу все запросы к нему.
+    def record_failure(self, status: int | None = None, retry_after: float | None = None):
+        if status == 429:
+            now = time.monotonic()
+            if now - self._slowed_down_at >= 1.0:
+                self._slowed_down_at = now
+                self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+                logger.warning("Хост %s просит снизить частоту запросов, новая скорость %.1f запросов/с.",
+                               self.host, self.bucket.rate)
+        else:
+            self.breaker.record_failure()
+        if retry_after:
+            self.bucket.pause(retry_after)
+
+
+# Правила по хостам (хост -> HostPolicy).
+_policies: dict[str, HostPolicy] = {}
+
+
+# Возвращает правила для хоста из адреса запроса (создает их при первом обращении).
+def policy_for(url: str) -> HostPolicy:
+    host = urlsplit(url).netloc
+    policy = _policies.get(host)
+    if policy is None:
+        policy = _policies[host] = HostPolicy(host)
+    return policy
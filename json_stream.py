@@ -0,0 +1,107 @@
+import codecs
+import json
+from typing import AsyncIterator
+
+# Пошаговый (потоковый) разбор больших JSON-ответов.
+# Вместо того чтобы загружать в память весь ответ и строить по нему огромный словарь,
+# читаем тело ответа кусками и отдаем элементы нужного массива по одному.
+# В памяти при этом держится только текущий кусок ответа и один разбираемый элемент.
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789+-.eE"
+
+
+# Буфер поверх потока байтов: хранит еще не разобранную часть текста и подкачивает новые куски по мере надобности.
+class _StreamReader:
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks.__aiter__()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    # Дочитывает следующий кусок. Возвращает False, если поток закончился.
+    async def fill(self) -> bool:
+        if self.eof:
+            return False
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self.eof = True
+            self.buffer = self.buffer[self.pos:] + self._utf8.decode(b"", final=True)
+            self.pos = 0
+            return False
+        # Уже разобранную часть выбрасываем, чтобы буфер не рос вместе с ответом.
+        self.buffer = self.buffer[self.pos:] + self._utf8.decode(chunk)
+        self.pos = 0
+        return True
+
+    # Возвращает следующий значимый символ (без пробелов), не сдвигая позицию. Пустая строка - конец потока.
+    async def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not await self.fill():
+                return ""
+
+    # Пропускает ожидаемый символ-разделитель.
+    async def expect(self, char: str):
+        found = await self.peek()
+        if found != char:
+            raise ValueError(f"Ожидался символ {char!r}, а получен {found!r} (позиция {self.pos}).")
+        self.pos += 1
+
+    # Разбирает одно JSON-значение целиком, при необходимости дочитывая поток.
+    async def read_value(self):
+        await self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if await self.fill(): # Значение оборвалось на границе куска - дочитываем.
+                    continue
+                raise
+            # Число в самом конце буфера могло оборваться на середине ("12" вместо "125" или "12." вместо "12.5").
+            if isinstance(value, (int, float)) and not self.buffer[end:].strip(_NUMBER_CHARS) and await self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+# Отдает по одному элементы массива, который лежит в JSON-объекте верхнего уровня под ключом key.
+# Остальные поля объекта пропускаются, а все, что идет после массива, вообще не читается.
+# Если вызывающий код прекращает перебор раньше, оставшаяся часть ответа тоже не разбирается.
+async def iter_array_items(chunks: AsyncIterator[bytes], key: str):
+    reader = _StreamReader(chunks)
+    await reader.expect("{")
+    if await reader.peek() == "}":
+        return
+
+    while True:
+        name = await reader.read_value()
+        await reader.expect(":")
+        if name == key:
+            if await reader.peek() != "[": # Например, null вместо пустого массива.
+                return
+            reader.pos += 1
+            if await reader.peek() == "]":
+                return
+            while True:
+                yield await reader.read_value()
+                separator = await reader.peek()
+                reader.pos += 1
+                if separator == "]":
+                    return
+                if separator != ",":
+                    raise ValueError(f"Ожидался символ ',' или ']', а получен {separator!r}.")
+
+        await reader.read_value() # Значение другого ключа нам не нужно.
+        separator = await reader.peek()
+        reader.pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"Ожидался символ ',' или '}}', а получен {separator!r}.")
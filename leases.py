@@ -0,0 +1,113 @@
+import logging
+import math
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from crud import dialect_insert, insert_ignore
+from database import SessionLocal
+from models import SchedulerWorker, ShardLease
+from config import SCHEDULER_SHARDS, LEASE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+# Аренда шардов одним процессом-планировщиком.
+# При каждом обновлении (refresh) процесс:
+#   1. отмечается в таблице scheduler_workers и считает, сколько процессов живо;
+#   2. продлевает аренду своих шардов;
+#   3. выравнивает нагрузку: если шардов больше справедливой доли, лишние отпускает,
+#      если меньше - забирает свободные или просроченные (например, у упавшего процесса).
+# Захват шардов делается одним UPDATE ... RETURNING, поэтому два процесса не могут получить один шард.
+class LeaseManager:
+    def __init__(self, owner: str | None = None, shard_count: int = SCHEDULER_SHARDS,
+                 ttl_seconds: float = LEASE_TTL_SECONDS):
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.shard_count = shard_count
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.shards: set[int] = set() # Шарды, которые сейчас держит этот процесс.
+
+    # Создает строки аренды для всех шардов (и убирает лишние, если число шардов уменьшили).
+    async def _ensure_shards(self, db: AsyncSession):
+        rows = [{"shard": shard} for shard in range(self.shard_count)]
+        await db.execute(insert_ignore(db, ShardLease.__table__, ["shard"]), rows)
+        await db.execute(delete(ShardLease).where(ShardLease.shard >= self.shard_count))
+
+    # Отмечает процесс как живой и возвращает число живых процессов.
+    async def _heartbeat(self, db: AsyncSession, now: datetime) -> int:
+        statement = dialect_insert(db, SchedulerWorker.__table__).values(owner=self.owner, heartbeat_at=now)
+        await db.execute(statement.on_conflict_do_update(index_elements=["owner"], set_={"heartbeat_at": now}))
+        await db.execute(delete(SchedulerWorker).where(SchedulerWorker.heartbeat_at < now - self.ttl))
+        return (await db.execute(select(func.count()).select_from(SchedulerWorker))).scalar_one()
+
+    # Продлевает аренду своих шардов и возвращает, какие шарды все еще наши.
+    async def _renew(self, db: AsyncSession, now: datetime) -> set[int]:
+        result = await db.execute(
+            update(ShardLease)
+            .where(ShardLease.owner == self.owner)
+            .values(lease_expires_at=now + self.ttl)
+            .returning(ShardLease.shard)
+        )
+        return set(result.scalars())
+
+    # Забирает до count свободных или просроченных шардов.
+    async def _claim(self, db: AsyncSession, now: datetime, count: int) -> set[int]:
+        free = (
+            select(ShardLease.shard)
+            .where(or_(ShardLease.owner.is_(None), ShardLease.lease_expires_at < now))
+            .order_by(ShardLease.shard)
+            .limit(count)
+            .with_for_update(skip_locked=True) # PostgreSQL: пропускаем строки, которые сейчас захватывает другой процесс.
+        )
+        result = await db.execute(
+            update(ShardLease)
+            .where(ShardLease.shard.in_(free.scalar_subquery()))
+            .where(or_(ShardLease.owner.is_(None), ShardLease.lease_expires_at < now))
+            .values(owner=self.owner, lease_expires_at=now + self.ttl)
+            .returning(ShardLease.shard)
+        )
+        return set(result.scalars())
+
+    # Отпускает указанные шарды, чтобы их могли забрать другие процессы.
+    async def _release(self, db: AsyncSession, shards: set[int]):
+        if shards:
+            await db.execute(
+                update(ShardLease)
+                .where(ShardLease.owner == self.owner, ShardLease.shard.in_(shards))
+                .values(owner=None, lease_expires_at=None)
+            )
+
+    # Обновляет аренду и возвращает шарды, которые этот процесс должен проверять.
+    async def refresh(self) -> set[int]:
+        now = datetime.utcnow()
+        async with SessionLocal() as db:
+            await self._ensure_shards(db)
+            live_workers = await self._heartbeat(db, now)
+            shards = await self._renew(db, now)
+
+            fair_share = math.ceil(self.shard_count / max(live_workers, 1))
+            if len(shards) > fair_share:
+                extra = set(sorted(shards)[fair_share:])
+                await self._release(db, extra)
+                shards -= extra
+            elif len(shards) < fair_share:
+                shards |= await self._claim(db, now, fair_share - len(shards))
+            await db.commit()
+
+        if shards != self.shards:
+            logger.info(f"Планировщик {self.owner}: шардов {len(shards)} из {self.shard_count} "
+                        f"(живых планировщиков: {live_workers}).")
+        self.shards = shards
+        return shards
+
+    # Отпускает все шарды и удаляет отметку процесса (при нормальной остановке).
+    async def release_all(self):
+        async with SessionLocal() as db:
+            await db.execute(
+                update(ShardLease).where(ShardLease.owner == self.owner).values(owner=None, lease_expires_at=None)
+            )
+            await db.execute(delete(SchedulerWorker).where(SchedulerWorker.owner == self.owner))
+            await db.commit()
+        self.shards = set()
@@ -1,14 +1,32 @@
 import asyncio
 import logging
+import signal
 from aiogram import Bot, Dispatcher
 
-from config import BOT_TOKEN
-from database import init_db
+from config import (
+    BOT_TOKEN, RUN_SCHEDULER_IN_BOT, METRICS_PORT, METRICS_HOST, LOG_LEVEL, WEBHOOK_URL, UPDATE_CONCURRENCY,
+)
+from database import init_db, engine
 from handlers import router
-from scheduler import check_for_new_reviews
+from metrics import start_metrics_server
+from notifier import run_notification_outbox
+from maintenance import run_maintenance_periodically
+from wildberries_api import create_http_session
 
 # Настраиваем, как будут выводиться сообщения о работе бота.
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+
+# Ждет Ctrl+C или сигнала SIGTERM (его присылают systemd и docker при остановке и перезапуске).
+async def _wait_for_stop_signal():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stop.set)
+        except (NotImplementedError, RuntimeError): # Windows: остается обычная обработка Ctrl+C.
+            pass
+    await stop.wait()
 
 
 # Основная функция, которая запускает бота.
@@ -20,27 +38,62 @@ async def main():
         return
 
     bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+    # Одна HTTP-сессия на все запросы к Wildberries: соединения переиспользуются между запросами.
+    http_session = create_http_session()
+    # Все, что передано в Dispatcher, aiogram подставляет в обработчики по имени аргумента.
+    dp = Dispatcher(http_session=http_session)
 
     dp.include_router(router) # Подключаем все наши команды (из handlers.py) к боту.
 
-    init_db() # Запускаем настройку базы данных
+    await init_db() # Запускаем настройку базы данных
+    # Если задан METRICS_PORT, отдаем метрики для Prometheus.
+    metrics_server = await start_metrics_server(METRICS_PORT, METRICS_HOST) if METRICS_PORT else None
 
-    logging.info("Запускаем планировщик проверки отзывов в фоновом режиме...")
-    # Запускаем проверку отзывов в отдельном режиме, чтобы она работала "в фоне"
-    # и не мешала боту отвечать на команды.
-    asyncio.create_task(check_for_new_reviews(bot))
+    if RUN_SCHEDULER_IN_BOT:
+        # Планировщик импортируем только здесь: если отзывы проверяют отдельные процессы (worker.py),
+        # боту он не нужен, и запуск получается быстрее.
+        from leases import LeaseManager
+        from scheduler import run_scheduler
+        logging.info("Запускаем планировщик проверки отзывов в фоновом режиме...")
+        # Запускаем проверку отзывов в отдельном режиме, чтобы она работала "в фоне"
+        # и не мешала боту отвечать на команды. Через аренду шардов бот делит товары
+        # с отдельными процессами-планировщиками (worker.py), если они запущены.
+        asyncio.create_task(run_scheduler(http_session, lease_manager=LeaseManager()))
+    else:
+        logging.info("RUN_SCHEDULER_IN_BOT=0: отзывы проверяют отдельные процессы-планировщики (worker.py).")
+    # Отдельно запускаем отправку уведомлений из очереди негативных отзывов.
+    asyncio.create_task(run_notification_outbox(bot))
+    # Раз в сутки переносим старые отзывы в архив и сжимаем базу данных (см. maintenance.py).
+    asyncio.create_task(run_maintenance_periodically())
 
-    logging.info("Бот запущен. Начинаем поллинг входящих сообщений...")
+    webhook_server = None
     try:
-        # Запускаем бота
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if WEBHOOK_URL:
+            # Режим webhook: обновления присылает сам Telegram (см. webhook.py).
+            from webhook import ensure_webhook, start_webhook_server
+            webhook_server = await start_webhook_server(dp, bot)
+            await ensure_webhook(bot, dp.resolve_used_update_types())
+            logging.info("Бот запущен. Принимаем обновления через webhook...")
+            await _wait_for_stop_signal()
+        else:
+            # Webhook мог остаться от запуска в режиме webhook - при нем Telegram не отдает обновления опросом.
+            await bot.delete_webhook(drop_pending_updates=False)
+            logging.info("Бот запущен. Начинаем поллинг входящих сообщений...")
+            # Каждое обновление обрабатывается отдельной задачей, но не больше UPDATE_CONCURRENCY одновременно.
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types(),
+                                   handle_as_tasks=True, tasks_concurrency_limit=UPDATE_CONCURRENCY)
     except Exception as e:
         # Если при запуске бота произошла ошибка, выводим её.
-        logging.error(f"Ошибка при запуске поллинга бота: {e}")
+        logging.error(f"Ошибка при запуске бота: {e}")
     finally:
         # Этот код выполнится, когда бот останавливается.
+        if webhook_server:
+            await webhook_server.cleanup() # Перестаем принимать обновления; webhook у Telegram не удаляем.
         await bot.session.close() # Закрываем соединение бота с Telegram.
+        await http_session.close() # Закрываем соединения с Wildberries.
+        if metrics_server:
+            await metrics_server.cleanup()
+        await engine.dispose() # Закрываем соединения с базой данных.
         logging.info("Сессия бота закрыта. Бот остановлен.")
 
 
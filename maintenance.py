@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from crud import archive_reviews_before
+from database import SessionLocal, engine, init_db
+import metrics
+from config import (
+    REVIEW_RETENTION_DAYS, REVIEW_ARCHIVE, MAINTENANCE_INTERVAL_SECONDS, MAINTENANCE_BATCH_SIZE,
+    VACUUM_MAX_PAGES, NOTIFY_MAX_ATTEMPTS, LOG_LEVEL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Обслуживание базы данных, чтобы таблица reviews не росла бесконечно:
+#   - отзывы старше REVIEW_RETENTION_DAYS дней переносятся в архив reviews_archive (только оценка и дата,
+#     без текста и автора) или просто удаляются, если REVIEW_ARCHIVE=0. Отзывы, уведомление о которых
+#     еще не отправлено, не трогаем;
+#   - освободившееся место возвращается системе (SQLite) и обновляется статистика для планировщика запросов.
+# Бот запускает обслуживание раз в MAINTENANCE_INTERVAL_SECONDS; его можно запускать и отдельно (например, из cron):
+#   python maintenance.py
+
+
+# Переносит старые отзывы в архив пачками по MAINTENANCE_BATCH_SIZE, каждая пачка - отдельная транзакция,
+# чтобы не держать базу занятой надолго. Возвращает, сколько отзывов перенесено.
+async def archive_old_reviews(retention_days: int = REVIEW_RETENTION_DAYS) -> int:
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    total = 0
+    while True:
+        with metrics.DB_SECONDS.time(operation="archive_reviews"):
+            async with SessionLocal() as db:
+                moved = await archive_reviews_before(db, cutoff, MAINTENANCE_BATCH_SIZE, NOTIFY_MAX_ATTEMPTS,
+                                                     archive=REVIEW_ARCHIVE)
+                await db.commit()
+        total += moved
+        if moved < MAINTENANCE_BATCH_SIZE:
+            return total
+        await asyncio.sleep(0) # Даем поработать другим задачам между пачками.
+
+
+# Возвращает освободившееся место и обновляет статистику таблиц.
+# SQLite: старую базу один раз переводим в режим auto_vacuum=INCREMENTAL полным VACUUM, дальше освобождаем
+# не больше VACUUM_MAX_PAGES страниц за раз (это быстро и не блокирует базу надолго).
+# PostgreSQL: место освобождает autovacuum, здесь только обновляем статистику (ANALYZE).
+async def compact_database():
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT") # VACUUM нельзя выполнять в транзакции.
+        if engine.dialect.name == "sqlite":
+            if (await conn.execute(text("PRAGMA auto_vacuum"))).scalar() != 2:
+                logger.info("Переводим базу SQLite в режим auto_vacuum=INCREMENTAL (полный VACUUM)...")
+                await conn.execute(text("VACUUM"))
+            freed = (await conn.execute(text("PRAGMA freelist_count"))).scalar()
+            await conn.execute(text(f"PRAGMA incremental_vacuum({int(VACUUM_MAX_PAGES)})"))
+            await conn.execute(text("PRAGMA optimize"))
+            logger.info("Свободных страниц в базе было %s, возвращено до %s.", freed, VACUUM_MAX_PAGES)
+        elif engine.dialect.name == "postgresql":
+            await conn.execute(text("ANALYZE reviews"))
+            await conn.execute(text("ANALYZE reviews_archive"))
+
+
+# Одно обслуживание: архивирование старых отзывов и сжатие базы.
+async def run_maintenance():
+    moved = await archive_old_reviews()
+    if moved:
+        action = "перенесено в архив" if REVIEW_ARCHIVE else "удалено"
+        logger.info("Отзывов старше %s дней %s: %s.", REVIEW_RETENTION_DAYS, action, moved)
+    with metrics.DB_SECONDS.time(operation="compact_database"):
+        await compact_database()
+
+
+# Запускает обслуживание раз в MAINTENANCE_INTERVAL_SECONDS (первый раз - через интервал после запуска бота).
+async def run_maintenance_periodically():
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            await run_maintenance()
+        except Exception as e:
+            logger.error(f"Ошибка при обслуживании базы данных: {e}")
+
+
+async def _main():
+    await init_db()
+    try:
+        await run_maintenance()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(_main())
@@ -0,0 +1,222 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Простые метрики в памяти процесса: счетчики, значения и гистограммы.
+# Их можно забрать в формате Prometheus с локального адреса (см. start_metrics_server)
+# или раз в период вывести одной строкой-сводкой (см. MetricsWindow).
+
+# Границы корзин гистограмм по умолчанию, в секундах.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Все созданные метрики, в порядке создания.
+_registry: list = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Общая часть всех метрик: имя, описание и значения по наборам меток.
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, а получены {tuple(labels)}.")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def _render_samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self._render_samples())
+
+
+# Счетчик: значение только растет (число запросов, добавленных отзывов и т.п.).
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    # Сумма по всем наборам меток (или по тем, что совпадают с переданными).
+    def total(self, **labels) -> float:
+        return sum(value for key, value in self._values.items() if set(labels.items()) <= set(key))
+
+
+# Значение, которое может и расти, и уменьшаться (число товаров в расписании и т.п.).
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+# Значения гистограммы для одного набора меток.
+class _HistogramValue:
+    def __init__(self, bucket_count: int):
+        self.buckets = [0] * bucket_count # Сколько наблюдений попало в каждую корзину (не накопительно).
+        self.count = 0
+        self.sum = 0.0
+
+
+# Гистограмма: распределение длительностей или размеров по корзинам.
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        histogram = self._values.get(key)
+        if histogram is None:
+            histogram = self._values[key] = _HistogramValue(len(self.buckets) + 1)
+        histogram.buckets[bisect.bisect_left(self.buckets, value)] += 1
+        histogram.count += 1
+        histogram.sum += value
+
+    # Замеряет, сколько секунд выполнялся блок with.
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    # Число наблюдений и их сумма по всем наборам меток (или по тем, что совпадают с переданными).
+    def totals(self, **labels) -> tuple[int, float]:
+        count, total = 0, 0.0
+        for key, histogram in self._values.items():
+            if set(labels.items()) <= set(key):
+                count += histogram.count
+                total += histogram.sum
+        return count, total
+
+    def _render_samples(self) -> list[str]:
+        lines = []
+        for key, histogram in self._values.items():
+            cumulative = 0
+            for bound, observed in zip(self.buckets + (float("inf"),), histogram.buckets):
+                cumulative += observed
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {histogram.count}")
+        return lines
+
+
+# Все метрики в текстовом формате Prometheus.
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# Метрики бота.
+WB_REQUEST_SECONDS = Histogram(
+    "wbbot_wb_request_seconds", "Длительность запроса к API Wildberries (вместе с чтением ответа).", ("endpoint",))
+WB_REQUESTS = Counter("wbbot_wb_requests_total", "Запросы к API Wildberries по результату.", ("endpoint", "status"))
+WB_RESPONSE_BYTES = Counter("wbbot_wb_response_bytes_total", "Прочитано байт из ответов Wildberries.", ("endpoint",))
+WB_PARSE_SECONDS = Histogram("wbbot_wb_parse_seconds", "Время разбора ответа Wildberries (без ожидания сети).",
+                             ("endpoint",))
+DB_SECONDS = Histogram("wbbot_db_seconds", "Длительность операций с базой данных.", ("operation",))
+PRODUCTS_CHECKED = Counter("wbbot_products_checked_total", "Проверенные товары по результату.", ("result",))
+REVIEWS_FETCHED = Counter("wbbot_reviews_fetched_total", "Отзывы новее отметки, полученные от Wildberries.")
+REVIEWS_INSERTED = Counter("wbbot_reviews_inserted_total", "Новые отзывы, добавленные в базу данных.")
+# result: sent и failed - отправленные и неотправленные сообщения, dropped - уведомления, которые некому отправить.
+NOTIFICATIONS = Counter("wbbot_notifications_total", "Отправленные в Telegram сообщения по результату.", ("result",))
+# Только для разового прохода по всем товарам (run_check_cycle, например в benchmarks/run.py). Постоянный планировщик
+# проходами не работает - у каждого товара свой интервал проверки; насколько он отстает, показывает POLL_LAG_SECONDS.
+CHECK_CYCLE_SECONDS = Histogram("wbbot_check_cycle_seconds",
+                                "Длительность разового прохода по всем товарам (run_check_cycle), не интервал проверки.",
+                                buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+POLL_LAG_SECONDS = Histogram("wbbot_poll_lag_seconds", "Насколько позже назначенного времени товар ушел на проверку.",
+                             buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800))
+SCHEDULED_PRODUCTS = Gauge("wbbot_scheduled_products", "Товары в расписании этого процесса.")
+
+
+# Сводка по метрикам за период: при каждом вызове summary() показывает, что изменилось с прошлого вызова.
+class MetricsWindow:
+    def __init__(self):
+        self._previous = self._snapshot()
+
+    @staticmethod
+    def _snapshot() -> dict:
+        return {
+            "ok": PRODUCTS_CHECKED.total(result="ok"),
+            "errors": PRODUCTS_CHECKED.total(result="error"),
+            "fetch": WB_REQUEST_SECONDS.totals(endpoint="feedbacks"),
+            "parse": WB_PARSE_SECONDS.totals(endpoint="feedbacks"),
+            "db": DB_SECONDS.totals(),
+            "bytes": WB_RESPONSE_BYTES.total(),
+            "fetched": REVIEWS_FETCHED.total(),
+            "inserted": REVIEWS_INSERTED.total(),
+            "sent": NOTIFICATIONS.total(result="sent"),
+            "lag": POLL_LAG_SECONDS.totals(),
+            "time": time.monotonic(),
+        }
+
+    def summary(self) -> str:
+        current = self._snapshot()
+        previous, self._previous = self._previous, current
+
+        def average_ms(name: str) -> str:
+            count = current[name][0] - previous[name][0]
+            total = current[name][1] - previous[name][1]
+            return f"{total / count * 1000:.0f} мс" if count else "-"
+
+        def delta(name: str) -> int:
+            return int(current[name] - previous[name])
+
+        return (
+            f"За {current['time'] - previous['time']:.0f} с: проверено товаров {delta('ok')} (ошибок {delta('errors')}), "
+            f"запрос отзывов в среднем {average_ms('fetch')}, разбор {average_ms('parse')}, "
+            f"база данных {average_ms('db')}, получено {delta('bytes') / 1024 / 1024:.1f} МБ, "
+            f"отзывов новее отметки {delta('fetched')}, новых в базе {delta('inserted')}, "
+            f"уведомлений отправлено {delta('sent')}, отставание от расписания в среднем {average_ms('lag')}."
+        )
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(body=render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+# Запускает HTTP-сервер с метриками по адресу http://host:port/metrics.
+# Возвращает runner; сервер останавливается через `await runner.cleanup()`.
+async def start_metrics_server(port: int, host: str = "127.0.0.1") -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны по адресу http://{host}:{port}/metrics")
+    return runner
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Boolean, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
@@ -13,9 +13,15 @@ class Product(Base):
     article = Column(String, unique=True, index=True, nullable=False)
     name = Column(String)
     last_checked = Column(DateTime, default=datetime.utcnow)
+    # "Отметка" товара: дата и ID самого нового сохраненного отзыва.
+    # Отзывы не новее отметки при следующей проверке уже не разбираются.
+    last_review_date = Column(DateTime)
+    last_review_id = Column(String)
 
     # Связь с отзывами: один товар может иметь много отзывов.
     reviews = relationship("Review", back_populates="product", cascade="all, delete-orphan")
+    # Связь с подписками: товар могут отслеживать несколько чатов.
+    subscriptions = relationship("Subscription", back_populates="product", cascade="all, delete-orphan")
 
     # Как показывать объект Product, если его вывести в консоль.
     def __repr__(self):
@@ -25,6 +31,12 @@ class Product(Base):
 # Здесь мы храним каждый отзыв, который нашли.
 class Review(Base):
     __tablename__ = "reviews" # Имя таблицы в базе данных.
+    __table_args__ = (
+        # Отзывы товара по дате: удаление товара, выборки за период, поиск старых отзывов для архива.
+        Index("ix_reviews_product_date", "product_id", "review_date"),
+        # Очередь уведомлений: неотправленные отзывы по порядку (см. get_pending_notifications).
+        Index("ix_reviews_notified", "is_notified", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
@@ -33,11 +45,121 @@ class Review(Base):
     text = Column(String)
     author = Column(String)
     review_date = Column(DateTime)
+    # Очередь уведомлений ("outbox"): отзыв ждет отправки, пока is_notified = False.
+    # Отзывы, о которых уведомлять не нужно (не негативные), сразу сохраняются с is_notified = True.
     is_notified = Column(Boolean, default=False)
+    notify_attempts = Column(Integer, nullable=False, default=0, server_default="0") # Сколько раз пытались отправить.
+    last_error = Column(String) # Текст последней ошибки отправки.
 
     # Связь с товаром: каждый отзыв относится к одному товару.
     product = relationship("Product", back_populates="reviews")
 
     # Как показывать объект Review, если его вывести в консоль.
     def __repr__(self):
-        return f"<Review(id={self.id}, product_id={self.product_id}, rating={self.rating}, text='{self.text[:50]}...')>"
\ No newline at end of file
+        return f"<Review(id={self.id}, product_id={self.product_id}, rating={self.rating}, text='{self.text[:50]}...')>"
+
+# Модель для таблицы "subscriptions" (подписок).
+# Подписка связывает чат Telegram с товаром: один товар могут отслеживать много чатов,
+# а один чат - много товаров. Отзывы товара при этом запрашиваются один раз, сколько бы ни было подписчиков.
+class Subscription(Base):
+    __tablename__ = "subscriptions"
+    __table_args__ = (
+        # Поиск товаров чата (chat_id -> product_id) и защита от повторной подписки.
+        UniqueConstraint("chat_id", "product_id", name="uq_subscriptions_chat_product"),
+        # Поиск подписчиков товара (product_id -> chat_id) при рассылке уведомлений.
+        Index("ix_subscriptions_product_chat", "product_id", "chat_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Связь с товаром: каждая подписка относится к одному товару.
+    product = relationship("Product", back_populates="subscriptions")
+
+    # Как показывать объект Subscription, если его вывести в консоль.
+    def __repr__(self):
+        return f"<Subscription(chat_id={self.chat_id}, product_id={self.product_id})>"
+
+
+# Модель для таблицы "reviews_archive" (архива старых отзывов).
+# Отзывы старше REVIEW_RETENTION_DAYS переносятся сюда из таблицы reviews (см. maintenance.py)
+# в сжатом виде: без текста и автора, только то, что нужно для статистики по товару.
+class ReviewArchive(Base):
+    __tablename__ = "reviews_archive"
+    __table_args__ = (
+        Index("ix_reviews_archive_product_date", "product_id", "review_date"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False) # Тот же id, что был в таблице reviews.
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    external_id = Column(String, nullable=False)
+    rating = Column(Integer, nullable=False)
+    review_date = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ReviewArchive(id={self.id}, product_id={self.product_id}, rating={self.rating})>"
+
+
+# Модель для таблицы "review_daily_stats" (сводки отзывов по дням).
+# Для каждого товара и дня (по UTC) хранится, сколько отзывов пришло с каждой оценкой.
+# Сводка пополняется вместе с сохранением новых отзывов и не зависит от архивации старых,
+# поэтому статистику за любой период можно посчитать, не перебирая таблицу reviews.
+class ReviewDailyStat(Base):
+    __tablename__ = "review_daily_stats"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    rating_1 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_2 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_3 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_4 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_5 = Column(Integer, nullable=False, default=0, server_default="0")
+
+    def __repr__(self):
+        counts = [self.rating_1, self.rating_2, self.rating_3, self.rating_4, self.rating_5]
+        return f"<ReviewDailyStat(product_id={self.product_id}, day={self.day}, ratings={counts})>"
+
+
+# Модель для таблицы "scheduler_workers" (запущенных планировщиков).
+# Каждый процесс-планировщик регулярно обновляет здесь свою отметку "жив",
+# по ним считается, сколько процессов делят между собой товары.
+class SchedulerWorker(Base):
+    __tablename__ = "scheduler_workers"
+
+    owner = Column(String, primary_key=True)
+    heartbeat_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<SchedulerWorker(owner='{self.owner}', heartbeat_at={self.heartbeat_at})>"
+
+
+# Модель для таблицы "shard_leases" (аренды частей списка товаров).
+# Товары делятся на части (шарды) по остатку от деления id товара на число шардов.
+# Шард проверяет только тот процесс, который держит его аренду; если процесс упал и перестал
+# продлевать аренду, после lease_expires_at шард забирает другой процесс.
+class ShardLease(Base):
+    __tablename__ = "shard_leases"
+
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String)
+    lease_expires_at = Column(DateTime, index=True)
+
+    def __repr__(self):
+        return f"<ShardLease(shard={self.shard}, owner='{self.owner}', lease_expires_at={self.lease_expires_at})>"
+
+
+# Модель для таблицы "schema_version" (версии схемы базы данных).
+# Одна строка с "отпечатком" всех таблиц и индексов, для которых база уже подготовлена.
+# Пока модели не менялись, init_db не создает таблицы и не проверяет колонки при каждом запуске.
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(String, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SchemaVersion(version='{self.version}', updated_at={self.updated_at})>"
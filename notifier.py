@@ -0,0 +1,268 @@
+import asyncio
+import logging
+from collections import deque, namedtuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from crud import get_pending_notifications, get_subscribers, mark_reviews_notified, record_notification_failure
+from database import SessionLocal
+from models import Product, Review
+from rate_limit import TokenBucket
+import metrics
+from config import (
+    NOTIFY_CHAT_ID, NOTIFY_WORKERS, NOTIFY_GLOBAL_RATE, NOTIFY_PER_CHAT_RATE, NOTIFY_DIGEST_THRESHOLD,
+    NOTIFY_MAX_ATTEMPTS, NOTIFY_BATCH_SIZE, NOTIFY_POLL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина одного сообщения в Telegram.
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Сколько раз подряд выполняем просьбу Telegram "подождать" (RetryAfter), прежде чем считать отправку неудачной.
+MAX_RETRY_AFTER = 5
+# Сколько сообщений может ждать отправки в один чат. Пока их больше, новые отзывы для этого чата из базы
+# не берем - очередь разбирается дальше для остальных чатов.
+MAX_CHAT_BACKLOG = 20
+# Сколько отзывов одновременно может находиться в отправке (их id исключаются из запроса к очереди).
+MAX_IN_FLIGHT = 2000
+
+# Одно уведомление (сообщение об отзыве или сводка): текст, id отзывов, о которых в нем говорится,
+# и чаты, которым его нужно отправить.
+Notification = namedtuple("Notification", ["text", "review_ids", "chat_ids"])
+# Одно сообщение для отправки в конкретный чат.
+Delivery = namedtuple("Delivery", ["chat_id", "text", "tracker"])
+
+
+# Результат рассылки одного уведомления по всем чатам-подписчикам.
+class _DeliveryTracker:
+    def __init__(self, notification: Notification):
+        self.notification = notification
+        self.remaining = len(notification.chat_ids)
+        self.sent = 0
+        self.errors: list[str] = []
+
+# Сигнал "в очереди появились новые отзывы", чтобы не ждать следующей периодической проверки.
+_wake_up = asyncio.Event()
+
+
+# Сообщает отправщику, что в очереди есть новые отзывы.
+def wake_up():
+    _wake_up.set()
+
+
+# Ссылка на отзывы товара на сайте Wildberries.
+def _feedbacks_url(product: Product) -> str:
+    return f"https://www.wildberries.ru/catalog/{product.article}/feedbacks"
+
+
+# Формирует текст уведомления об одном отзыве.
+def format_notification(product: Product, review: Review) -> str:
+    return (
+        f"🔴 Новый негативный отзыв!\n"
+        f"Товар: {product.name}\n"
+        f"Оценка: {'⭐' * review.rating} ({review.rating}/5)\n"
+        f"Отзыв: \"{review.text}\"\n"
+        f"Автор: {review.author}\n"
+        f"Дата отзыва: {review.review_date.strftime('%d.%m.%Y %H:%M')}\n"
+        f"{_feedbacks_url(product)}"
+    )
+
+
+# Формирует одно сообщение-сводку о нескольких отзывах на один товар.
+# Если все отзывы не помещаются в одно сообщение, остальные только пересчитываются в конце.
+def format_digest(product: Product, reviews: list[Review]) -> str:
+    header = f"🔴 Новых негативных отзывов: {len(reviews)}\nТовар: {product.name}\n{_feedbacks_url(product)}\n"
+    lines = []
+    length = len(header)
+    for shown, review in enumerate(reviews):
+        text = review.text or ""
+        text = text if len(text) <= 200 else text[:200] + "…"
+        line = f"\n{'⭐' * review.rating} ({review.rating}/5), {review.review_date.strftime('%d.%m.%Y %H:%M')}, " \
+               f"{review.author}: \"{text}\""
+        tail = f"\n\n…и еще {len(reviews) - shown} отзывов."
+        if length + len(line) + len(tail) > TELEGRAM_MESSAGE_LIMIT:
+            lines.append(tail)
+            break
+        lines.append(line)
+        length += len(line)
+    return header + "".join(lines)
+
+
+# Собирает уведомления для пачки отзывов из очереди: если у товара много отзывов, они объединяются в сводку.
+# subscribers - чаты, подписанные на каждый товар; товары без подписчиков (добавленные до появления
+# подписок) уведомляют чат NOTIFY_CHAT_ID, если он задан.
+def build_notifications(pending: list[tuple[Review, Product]], subscribers: dict[int, list[int]]) -> list[Notification]:
+    by_product: dict[int, tuple[Product, list[Review]]] = {}
+    for review, product in pending:
+        by_product.setdefault(product.id, (product, []))[1].append(review)
+
+    notifications = []
+    for product, reviews in by_product.values():
+        chat_ids = subscribers.get(product.id) or ([NOTIFY_CHAT_ID] if NOTIFY_CHAT_ID is not None else [])
+        if NOTIFY_DIGEST_THRESHOLD and len(reviews) >= NOTIFY_DIGEST_THRESHOLD:
+            notifications.append(Notification(format_digest(product, reviews), [review.id for review in reviews], chat_ids))
+        else:
+            notifications.extend(
+                Notification(format_notification(product, review), [review.id], chat_ids) for review in reviews
+            )
+    return notifications
+
+
+# Отправка уведомлений из очереди в Telegram с учетом ограничений скорости.
+# У каждого чата своя очередь сообщений ("полоса") со своим ограничением скорости: пока один чат ждет
+# (лимит сообщений в чат или просьба Telegram подождать), остальные чаты получают сообщения без задержки.
+# Одновременно отправляется не больше NOTIFY_WORKERS сообщений и не больше NOTIFY_GLOBAL_RATE в секунду.
+class NotificationSender:
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.global_bucket = TokenBucket(NOTIFY_GLOBAL_RATE)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._send_slots = asyncio.Semaphore(NOTIFY_WORKERS)
+        self._lanes: dict[int, deque[Delivery]] = {} # чат -> сообщения, которые ждут отправки в этот чат
+        self._lane_tasks: set[asyncio.Task] = set()
+        self._in_flight: set[int] = set() # id отзывов, уведомления о которых сейчас отправляются
+        self._progress = asyncio.Event() # Какое-то уведомление разослано - можно брать из очереди следующие.
+        self._failures = 0 # Сколько уведомлений с прошлой загрузки очереди не удалось отправить ни одному чату.
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(NOTIFY_PER_CHAT_RATE, capacity=1)
+        return bucket
+
+    # Отправляет одно сообщение. Если Telegram просит подождать (RetryAfter), ставим этот чат
+    # на паузу на указанное время и повторяем; остальные ошибки передаются вызывающему коду.
+    # Лимит чата ждем до того, как занять место отправителя, - ожидание одного чата не задерживает другие.
+    async def send(self, delivery: Delivery):
+        chat_bucket = self._chat_bucket(delivery.chat_id)
+        for _ in range(MAX_RETRY_AFTER):
+            await chat_bucket.acquire()
+            async with self._send_slots:
+                await self.global_bucket.acquire()
+                try:
+                    await self.bot.send_message(delivery.chat_id, delivery.text)
+                    return
+                except TelegramRetryAfter as e:
+                    logger.warning(f"Telegram просит подождать {e.retry_after} с перед отправкой в чат {delivery.chat_id}.")
+                    chat_bucket.pause(e.retry_after)
+        raise RuntimeError(f"Telegram {MAX_RETRY_AFTER} раз подряд попросил подождать")
+
+    # Записывает в базу данных итог рассылки уведомления, когда отправки во все чаты завершены.
+    # Если хотя бы один чат получил сообщение, уведомление считается отправленным (иначе остальные чаты
+    # получили бы его повторно). Если не получил никто, отзывы остаются в очереди для повторной попытки.
+    async def _finish(self, tracker: _DeliveryTracker):
+        review_ids = tracker.notification.review_ids
+        try:
+            with metrics.DB_SECONDS.time(operation="finish_notification"):
+                async with SessionLocal() as db:
+                    if tracker.sent or not tracker.errors:
+                        await mark_reviews_notified(db, review_ids)
+                    else:
+                        self._failures += 1
+                        await record_notification_failure(db, review_ids, tracker.errors[-1])
+                    await db.commit()
+        finally:
+            self._in_flight.difference_update(review_ids)
+            self._progress.set()
+
+    # Отправляет одно сообщение и, если это была последняя отправка уведомления, записывает итог.
+    async def _deliver(self, delivery: Delivery):
+        tracker = delivery.tracker
+        try:
+            try:
+                await self.send(delivery)
+                tracker.sent += 1
+                metrics.NOTIFICATIONS.inc(result="sent")
+            except Exception as e:
+                logger.error(f"Не удалось отправить уведомление в чат {delivery.chat_id}: {e}")
+                tracker.errors.append(str(e))
+                metrics.NOTIFICATIONS.inc(result="failed")
+            tracker.remaining -= 1
+            if tracker.remaining == 0:
+                # Отмечаем сразу после отправки, чтобы после перезапуска не отправить то же самое повторно.
+                await self._finish(tracker)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении результата отправки уведомления: {e}")
+
+    # Полоса одного чата: отправляет его сообщения по порядку и завершается, когда они закончились.
+    async def _run_lane(self, chat_id: int):
+        lane = self._lanes[chat_id]
+        try:
+            while lane:
+                await self._deliver(lane.popleft())
+        finally:
+            del self._lanes[chat_id]
+
+    # Ставит сообщение в полосу его чата (и запускает полосу, если ее еще нет).
+    def _enqueue(self, delivery: Delivery):
+        lane = self._lanes.get(delivery.chat_id)
+        if lane is None:
+            lane = self._lanes[delivery.chat_id] = deque()
+            task = asyncio.create_task(self._run_lane(delivery.chat_id))
+            self._lane_tasks.add(task)
+            task.add_done_callback(self._lane_tasks.discard)
+        lane.append(delivery)
+
+    # Основной цикл: забирает отзывы из очереди в базе данных и раздает сообщения по полосам чатов.
+    # Следующая пачка загружается, не дожидаясь окончания всей предыдущей (отзывы, которые еще
+    # отправляются, пропускаются), поэтому медленный чат не задерживает уведомления другим чатам.
+    async def run(self):
+        if NOTIFY_CHAT_ID is None:
+            logger.info("NOTIFY_CHAT_ID не установлен: уведомления получают только чаты, подписанные на товар.")
+
+        try:
+            while True:
+                _wake_up.clear()
+                self._progress.clear()
+                self._failures = 0
+                pending = []
+                busy_chats = {chat_id for chat_id, lane in self._lanes.items() if len(lane) >= MAX_CHAT_BACKLOG}
+                if len(self._in_flight) < MAX_IN_FLIGHT:
+                    try:
+                        with metrics.DB_SECONDS.time(operation="load_notifications"):
+                            async with SessionLocal() as db:
+                                pending = await get_pending_notifications(
+                                    db, NOTIFY_BATCH_SIZE, NOTIFY_MAX_ATTEMPTS, exclude_ids=self._in_flight,
+                                    exclude_chat_ids=busy_chats, exclude_unsubscribed=NOTIFY_CHAT_ID in busy_chats)
+                                subscribers = await get_subscribers(db, {product.id for _, product in pending})
+                    except Exception as e:
+                        logger.error(f"Не удалось прочитать очередь уведомлений: {e}")
+                        pending, subscribers = [], {}
+
+                for notification in build_notifications(pending, subscribers):
+                    tracker = _DeliveryTracker(notification)
+                    self._in_flight.update(notification.review_ids)
+                    if not notification.chat_ids:
+                        # Уведомлять некого: на товар никто не подписан, а NOTIFY_CHAT_ID не задан. Оставить отзывы
+                        # в очереди нельзя - они занимали бы каждую пачку, - поэтому убираем их, но не молча.
+                        logger.warning(f"Уведомление об отзывах ({len(notification.review_ids)} шт., первый id "
+                                       f"{notification.review_ids[0]}) некому отправить: на товар никто не подписан, "
+                                       f"а NOTIFY_CHAT_ID не задан. Уведомление пропущено.")
+                        metrics.NOTIFICATIONS.inc(result="dropped")
+                        try:
+                            await self._finish(tracker)
+                        except Exception as e:
+                            logger.error(f"Ошибка при сохранении результата отправки уведомления: {e}")
+                    for chat_id in notification.chat_ids: # Каждому подписчику - свое сообщение.
+                        self._enqueue(Delivery(chat_id, notification.text, tracker))
+
+                # Если в очереди, возможно, есть еще отзывы (или мы пропустили отзывы занятых чатов),
+                # берем их, как только какое-нибудь уведомление будет разослано;
+                # иначе ждем новых отзывов. После ошибок отправки тоже ждем, чтобы не повторять их сразу.
+                waiters = [_wake_up.wait()]
+                if (len(pending) == NOTIFY_BATCH_SIZE or busy_chats or len(self._in_flight) >= MAX_IN_FLIGHT) \
+                        and not self._failures:
+                    waiters.append(self._progress.wait())
+                tasks = [asyncio.create_task(waiter) for waiter in waiters]
+                try:
+                    await asyncio.wait(tasks, timeout=NOTIFY_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+        finally:
+            for task in list(self._lane_tasks):
+                task.cancel()
+
+
+# Запускает отправку уведомлений из очереди (работает, пока бот не остановится).
+async def run_notification_outbox(bot: Bot):
+    await NotificationSender(bot).run()
@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+
+# Ограничитель скорости по алгоритму "ведро с жетонами" (token bucket).
+# Жетоны копятся со скоростью rate в секунду, но не больше capacity; каждое действие забирает один жетон.
+# Если жетонов нет, acquire() ждет, пока накопится новый. Ожидающие обслуживаются по очереди.
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    # Приостанавливает выдачу жетонов на seconds секунд (например, сервер попросил подождать).
+    def pause(self, seconds: float):
+        self._tokens = 0.0
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._updated = self._paused_until # Во время паузы жетоны не копятся.
+
+    # Ждет и забирает один жетон.
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
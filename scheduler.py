@@ -1,80 +1,466 @@
 import asyncio
-from datetime import datetime
-from aiogram import Bot
-from sqlalchemy.orm import Session
+import heapq
+import random
+import time
+import aiohttp
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from models import Product, Review
+from models import Product
 from database import SessionLocal
-from wildberries_api import get_product_reviews
+from crud import (
+    save_new_reviews, advance_product_watermark, newest_review, to_naive_utc,
+    update_product_names, add_review_daily_stats,
+)
+from config import (
+    FETCH_CONCURRENCY, FETCH_TIMEOUT_SECONDS, INITIAL_LOOKBACK_DAYS, NEGATIVE_MAX_RATING,
+    POLL_MIN_INTERVAL_SECONDS, POLL_MAX_INTERVAL_SECONDS, POLL_TARGET_REVIEWS, POLL_NEGATIVE_WEIGHT,
+    PRODUCT_REFRESH_SECONDS, PRODUCT_NAME_REFRESH_SECONDS, SCHEDULER_SHARDS, LEASE_RENEW_SECONDS, LEASE_TTL_SECONDS,
+    METRICS_SUMMARY_SECONDS,
+)
+import metrics
+from leases import LeaseManager
+from notifier import wake_up
+from wildberries_api import get_product_reviews, get_products_info
+
+CHECK_INTERVAL_SECONDS = 30 * 60 # Начальный интервал проверки товара: 30 минут
+RETRY_DELAY_SECONDS = 15 # Через сколько повторяем проверку товара после первой неудачи (дальше пауза растет вдвое).
+CYCLE_RETRY_ROUNDS = 2 # Сколько раз за один проход (run_check_cycle) повторяем неудавшиеся товары.
+RESTART_DELAY_SECONDS = 10 # Через сколько перезапускаем планировщик после ошибки в одной из его задач.
+
+# Короткое описание товара, которое передается между задачами проверки.
+# Используем его вместо объекта Product, чтобы не держать сессию БД открытой во время запросов к API.
+ProductRef = namedtuple("ProductRef", ["id", "article", "name", "last_review_date", "last_review_id"])
+
+
+# Загружает список отслеживаемых товаров из базы данных.
+# Если переданы shards, загружаются только товары из этих шардов (шард товара - id % SCHEDULER_SHARDS).
+async def load_products(shards: set[int] | None = None) -> list[ProductRef]:
+    statement = select(Product.id, Product.article, Product.name, Product.last_review_date, Product.last_review_id)
+    if shards is not None:
+        if not shards:
+            return []
+        statement = statement.where((Product.id % SCHEDULER_SHARDS).in_(shards))
+    with metrics.DB_SECONDS.time(operation="load_products"):
+        async with SessionLocal() as db:
+            rows = (await db.execute(statement)).all()
+    return [ProductRef(*row) for row in rows]
+
+
+# Получает отзывы одного товара. Ошибка или зависание одного товара не должны мешать остальным,
+# поэтому любая ошибка здесь превращается в результат None - такой товар проверяется повторно.
+# Запрашиваются только отзывы новее "отметки" товара; для нового товара - за последние INITIAL_LOOKBACK_DAYS дней.
+async def fetch_product_reviews(product: ProductRef, session: aiohttp.ClientSession):
+    since = product.last_review_date or datetime.utcnow() - timedelta(days=INITIAL_LOOKBACK_DAYS)
+    try:
+        return await asyncio.wait_for(
+            get_product_reviews(product.article, since=since, since_id=product.last_review_id, session=session),
+            timeout=FETCH_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"ERROR_SCHEDULER: Превышено время ожидания отзывов для товара {product.article}.")
+    except Exception as e:
+        print(f"ERROR_SCHEDULER: Ошибка при получении отзывов для товара {product.article}: {e}")
+    return None
+
+
+# Рабочая задача: берет товары из очереди, получает их отзывы и складывает результат в очередь результатов.
+# None в очереди означает, что задача должна завершиться.
+async def _fetch_worker(jobs: asyncio.Queue, results: asyncio.Queue, session: aiohttp.ClientSession):
+    while True:
+        product = await jobs.get()
+        if product is None:
+            return
+        reviews = await fetch_product_reviews(product, session)
+        await results.put((product, reviews))
+
+
+# Сохраняет новые отзывы одного товара в базу данных одной транзакцией вместе со сводкой по дням
+# и новой "отметкой" товара и возвращает добавленные отзывы. Уведомления о них отправляет notifier.py.
+async def store_reviews(db: AsyncSession, product: ProductRef, reviews: list[dict]) -> list[dict]:
+    new_reviews = await save_new_reviews(db, product.id, reviews)
+    await add_review_daily_stats(db, product.id, new_reviews) # В той же транзакции, что и сами отзывы.
+    await advance_product_watermark(db, product.id, reviews)
+    await db.commit()
+
+    # Негативные отзывы уже лежат в очереди уведомлений - будим отправщика.
+    if any(review['rating'] <= NEGATIVE_MAX_RATING for review in new_reviews):
+        wake_up()
+    return new_reviews
+
+
+# Единственный потребитель результатов: все записи в базу данных идут через него по очереди.
+# После обработки каждого товара вызывается on_result(product, reviews, new_reviews),
+# где reviews равен None, если отзывы получить или сохранить не удалось.
+# Возвращает, сколько новых отзывов было добавлено.
+async def _store_worker(results: asyncio.Queue, on_result=None) -> int:
+    inserted_total = 0
+    async with SessionLocal() as db:
+        while True:
+            item = await results.get()
+            if item is None: # Сигнал, что новых результатов не будет.
+                return inserted_total
+            product, reviews = item
+            new_reviews = []
+            # Итоги по отдельным товарам не выводим - они попадают в метрики и в сводку (см. metrics.py).
+            # Если отзывы получить не удалось (None, ошибка уже выведена) или нет отзывов новее отметки,
+            # в базу данных ничего не пишем.
+            if reviews:
+                metrics.REVIEWS_FETCHED.inc(len(reviews))
+                try:
+                    with metrics.DB_SECONDS.time(operation="store_reviews"):
+                        new_reviews = await store_reviews(db, product, reviews)
+                    inserted_total += len(new_reviews)
+                    metrics.REVIEWS_INSERTED.inc(len(new_reviews))
+                except Exception as e: # Ошибка при записи одного товара не должна останавливать остальные.
+                    print(f"ERROR_SCHEDULER: Ошибка при сохранении отзывов для товара {product.article}: {e}")
+                    await db.rollback()
+                    reviews = None
+            metrics.PRODUCTS_CHECKED.inc(result="error" if reviews is None else "ok")
+            if on_result is not None:
+                on_result(product, reviews, new_reviews)
+
+
+# Один проход по списку товаров. Товары проверяются параллельно (не больше concurrency одновременно),
+# а результаты по одному записываются в базу данных. Возвращает количество новых отзывов.
+async def _run_pass(products: list[ProductRef], session: aiohttp.ClientSession, concurrency: int,
+                    on_result=None) -> int:
+    jobs = asyncio.Queue()
+    for product in products:
+        jobs.put_nowait(product)
+    worker_count = min(concurrency, len(products))
+    for _ in range(worker_count):
+        jobs.put_nowait(None) # Каждой рабочей задаче - сигнал завершения после товаров.
+
+    # Очередь результатов ограничена, чтобы быстрые запросы не накапливали в памяти слишком много отзывов.
+    results = asyncio.Queue(maxsize=concurrency * 2)
+    store_task = asyncio.create_task(_store_worker(results, on_result=on_result))
+
+    workers = [
+        asyncio.create_task(_fetch_worker(jobs, results, session))
+        for _ in range(worker_count)
+    ]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await results.put(None) # Говорим потребителю, что новых результатов не будет.
+    return await store_task
+
+
+# Одна проверка всех товаров. Все запросы идут через общую HTTP-сессию.
+# Товары, которые не удалось проверить, после паузы проверяются еще раз (не больше CYCLE_RETRY_ROUNDS раз).
+# Возвращает количество новых отзывов, добавленных в базу данных. В конце выводится сводка по проходу.
+# on_result(product, reviews, new_reviews), если передан, вызывается после обработки каждого товара (см. _store_worker).
+async def run_check_cycle(products: list[ProductRef], session: aiohttp.ClientSession,
+                          concurrency: int = FETCH_CONCURRENCY, on_result=None) -> int:
+    window = metrics.MetricsWindow()
+    started = time.monotonic()
+    inserted = 0
+    remaining = products
+    for retry_round in range(CYCLE_RETRY_ROUNDS + 1):
+        failed = []
+
+        def record_result(product, reviews, new_reviews):
+            if reviews is None:
+                failed.append(product)
+            if on_result:
+                on_result(product, reviews, new_reviews)
+
+        inserted += await _run_pass(remaining, session, concurrency, on_result=record_result)
+        if not failed or retry_round == CYCLE_RETRY_ROUNDS:
+            break
+        delay = RETRY_DELAY_SECONDS * 2 ** retry_round
+        print(f"Не удалось проверить товаров: {len(failed)}, повторим через {delay:.0f} с.")
+        await asyncio.sleep(delay)
+        remaining = failed
+    metrics.CHECK_CYCLE_SECONDS.observe(time.monotonic() - started)
+    print(f"Проверка {len(products)} товаров завершена. {window.summary()}")
+    return inserted
+
+
+# Обновляет названия отслеживаемых товаров (из шардов shards, если они переданы): информация
+# запрашивается пачками, а в базу данных записываются только изменившиеся названия.
+async def refresh_product_names(session: aiohttp.ClientSession, shards: set[int] | None = None) -> int:
+    products = await load_products(shards)
+    products_info = await get_products_info([product.article for product in products], session=session)
+    changed = {
+        product.id: products_info[product.article]['name']
+        for product in products
+        if products_info.get(product.article) and products_info[product.article]['name'] != product.name
+    }
+    async with SessionLocal() as db:
+        await update_product_names(db, changed)
+        await db.commit()
+    return len(changed)
+
+
+# Периодически обновляет названия товаров (только своих шардов, если планировщиков несколько).
+async def refresh_product_names_periodically(session: aiohttp.ClientSession, lease_manager: LeaseManager | None = None):
+    while True:
+        await asyncio.sleep(PRODUCT_NAME_REFRESH_SECONDS)
+        try:
+            changed = await refresh_product_names(session, lease_manager.shards if lease_manager else None)
+            print(f"Названия товаров обновлены, изменилось: {changed}.")
+        except Exception as e:
+            print(f"ERROR_SCHEDULER: Не удалось обновить названия товаров: {e}")
+
+
+# Раз в METRICS_SUMMARY_SECONDS выводит сводку: сколько товаров проверено, на что ушло время и т.д.
+async def print_metrics_summary_periodically():
+    window = metrics.MetricsWindow()
+    while True:
+        await asyncio.sleep(METRICS_SUMMARY_SECONDS)
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {window.summary()}")
+
+
+# Состояние опроса одного товара в адаптивном планировщике.
+@dataclass
+class PollState:
+    product: ProductRef
+    interval: float # Текущий интервал между проверками, в секундах.
+    next_due: float # Когда товар нужно проверить в следующий раз (по time.monotonic()).
+    last_polled: float | None = None
+    review_rate: float = 0.0 # Сглаженная скорость появления новых отзывов, отзывов в секунду.
+    negative_share: float = 0.0 # Сглаженная доля негативных среди новых отзывов.
+    in_flight: bool = False # Товар сейчас проверяется.
+    failures: int = 0 # Сколько проверок подряд не удалось.
+
+
+# Адаптивное расписание проверок.
+# Товары лежат в куче по времени следующей проверки. Интервал каждого товара подстраивается
+# под то, как часто у него появляются отзывы: "горячие" товары проверяются чаще, "тихие" - реже,
+# а товары с большой долей негативных отзывов - еще чаще. Интервал всегда в пределах [min_interval, max_interval].
+class AdaptivePollScheduler:
+    SMOOTHING = 0.3 # Вес последнего наблюдения при сглаживании скорости отзывов.
+
+    def __init__(self, min_interval: float = POLL_MIN_INTERVAL_SECONDS,
+                 max_interval: float = POLL_MAX_INTERVAL_SECONDS,
+                 initial_interval: float = CHECK_INTERVAL_SECONDS):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = min(max(initial_interval, min_interval), max_interval)
+        self._states: dict[int, PollState] = {}
+        self._heap: list[tuple[float, int]] = [] # (время следующей проверки, id товара)
+        self._synced = False
+
+    def __len__(self):
+        return len(self._states)
+
+    def _push(self, state: PollState):
+        heapq.heappush(self._heap, (state.next_due, state.product.id))
+
+    # Сверяет расписание со списком товаров из базы данных: добавляет новые товары и убирает удаленные.
+    # При первом запуске проверки товаров равномерно распределяются по начальному интервалу,
+    # чтобы не запрашивать все товары одновременно. Товары, добавленные позже, проверяются сразу.
+    def sync_products(self, products: list[ProductRef]):
+        now = time.monotonic()
+        current_ids = set()
+        for product in products:
+            current_ids.add(product.id)
+            state = self._states.get(product.id)
+            if state is not None:
+                # Название могло измениться; "отметку" в памяти не трогаем - она бывает новее прочитанной из базы.
+                state.product = state.product._replace(name=product.name)
+                continue
+            delay = random.uniform(0, self.min_interval) if not self._synced else 0.0
+            state = PollState(product=product, interval=self.initial_interval, next_due=now + delay)
+            self._states[product.id] = state
+            self._push(state)
+        for product_id in set(self._states) - current_ids:
+            del self._states[product_id] # Запись в куче станет "мертвой" и будет пропущена.
+        self._synced = True
+        metrics.SCHEDULED_PRODUCTS.set(len(self._states))
+
+    # Сколько секунд осталось до ближайшей проверки (None, если товаров нет).
+    def seconds_until_next(self) -> float | None:
+        self._drop_stale()
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.monotonic())
+
+    # Убирает с вершины кучи записи удаленных товаров и устаревшие записи.
+    def _drop_stale(self):
+        while self._heap:
+            due, product_id = self._heap[0]
+            state = self._states.get(product_id)
+            if state is not None and not state.in_flight and state.next_due == due:
+                return
+            heapq.heappop(self._heap)
+
+    # Достает следующий товар, которому пора на проверку, или None.
+    def pop_due(self) -> ProductRef | None:
+        self._drop_stale()
+        now = time.monotonic()
+        if not self._heap or self._heap[0][0] > now:
+            return None
+        due, product_id = heapq.heappop(self._heap)
+        metrics.POLL_LAG_SECONDS.observe(now - due) # Насколько опоздали с проверкой.
+        state = self._states[product_id]
+        state.in_flight = True
+        return state.product
+
+    # Учитывает результат проверки товара и назначает время следующей проверки.
+    def record_result(self, product: ProductRef, reviews: list[dict] | None, new_reviews: list[dict]):
+        state = self._states.get(product.id)
+        if state is None: # Товар удалили, пока он проверялся.
+            return
+        now = time.monotonic()
+        state.in_flight = False
+        if reviews is None:
+            # Проверка не удалась - товар снова ставится в очередь: сначала через RETRY_DELAY_SECONDS,
+            # после каждой следующей неудачи пауза растет вдвое, но не больше минимального интервала.
+            state.failures += 1
+            delay = min(RETRY_DELAY_SECONDS * 2 ** (state.failures - 1), self.min_interval)
+            state.next_due = now + delay * random.uniform(0.8, 1.2) # Разброс, чтобы повторы не шли одной пачкой.
+            self._push(state)
+            return
+        state.failures = 0
+
+        # За какой промежуток времени накопились эти отзывы. При самой первой проверке
+        # нового товара это окно INITIAL_LOOKBACK_DAYS, иначе - время с прошлой проверки.
+        if state.last_polled is not None:
+            elapsed = now - state.last_polled
+        elif product.last_review_date is None:
+            elapsed = INITIAL_LOOKBACK_DAYS * 24 * 60 * 60
+        else:
+            elapsed = None
+        if elapsed:
+            observed_rate = len(new_reviews) / elapsed
+            state.review_rate += self.SMOOTHING * (observed_rate - state.review_rate)
+            if new_reviews:
+                negative = sum(1 for review in new_reviews if review['rating'] <= NEGATIVE_MAX_RATING)
+                state.negative_share += self.SMOOTHING * (negative / len(new_reviews) - state.negative_share)
+
+        newest = newest_review(reviews)
+        if newest is not None: # Запоминаем новую "отметку", чтобы следующая проверка начала с нее.
+            state.product = state.product._replace(
+                last_review_date=to_naive_utc(newest['review_date']), last_review_id=str(newest['external_id']))
+
+        state.last_polled = now
+        state.interval = self._next_interval(state)
+        state.next_due = now + state.interval
+        self._push(state)
+
+    # Интервал подбирается так, чтобы за одну проверку находить примерно POLL_TARGET_REVIEWS новых отзывов.
+    # Чтобы расписание не "прыгало", интервал растет не больше чем вдвое за одну проверку.
+    def _next_interval(self, state: PollState) -> float:
+        if state.review_rate > 0:
+            interval = POLL_TARGET_REVIEWS / state.review_rate
+        else:
+            interval = self.max_interval
+        interval *= 1 - POLL_NEGATIVE_WEIGHT * state.negative_share
+        interval = min(interval, state.interval * 2)
+        return min(max(interval, self.min_interval), self.max_interval)
+
+
+# Фоновые задачи планировщика должны работать все время. Если какая-то из них завершилась (обычно из-за ошибки),
+# планировщик дальше работать не может - например, без задачи сохранения рабочие задачи навсегда встанут
+# на заполненной очереди результатов. Поэтому останавливаем весь планировщик с ошибкой этой задачи.
+def _check_background_tasks(tasks: list[asyncio.Task]):
+    for task in tasks:
+        if task.done():
+            error = None if task.cancelled() else task.exception()
+            raise RuntimeError(f"Фоновая задача планировщика {task.get_name()} остановилась: {error!r}") from error
+
+
+# Ставит товар в очередь рабочим задачам. Если очередь заполнена, ждет свободного места,
+# но при этом следит, чтобы фоновые задачи не остановились (иначе место может не освободиться никогда).
+async def _put_job(jobs: asyncio.Queue, product: ProductRef, tasks: list[asyncio.Task]):
+    try:
+        jobs.put_nowait(product)
+        return
+    except asyncio.QueueFull:
+        pass
+    put = asyncio.ensure_future(jobs.put(product))
+    try:
+        await asyncio.wait([put, *tasks], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        if not put.done():
+            put.cancel()
+    if not put.done() or put.cancelled():
+        _check_background_tasks(tasks)
 
-CHECK_INTERVAL_SECONDS = 30 * 60 # Интервал проверки: 30 минут
 
 # Главная функция-планировщик для проверки отзывов.
-async def check_for_new_reviews(bot: Bot):
+# Работает непрерывно: товары, которым подошло время, сразу отдаются рабочим задачам,
+# а после сохранения результата каждому товару назначается следующее время проверки.
+# Если передан lease_manager, планировщик проверяет только товары из арендованных шардов,
+# а остальные товары проверяют другие процессы (см. worker.py).
+async def check_for_new_reviews(session: aiohttp.ClientSession,
+                                concurrency: int = FETCH_CONCURRENCY, lease_manager: LeaseManager | None = None):
+    poller = AdaptivePollScheduler()
+    jobs = asyncio.Queue(maxsize=concurrency)
+    results = asyncio.Queue(maxsize=concurrency * 2)
+    store_task = asyncio.create_task(_store_worker(results, on_result=poller.record_result), name="store_reviews")
+    workers = [asyncio.create_task(_fetch_worker(jobs, results, session), name=f"fetch_worker_{index}")
+               for index in range(concurrency)]
+    names_task = asyncio.create_task(refresh_product_names_periodically(session, lease_manager),
+                                     name="refresh_product_names")
+    summary_task = asyncio.create_task(print_metrics_summary_periodically(), name="metrics_summary")
+    background = workers + [store_task, names_task, summary_task]
+    # Аренду нужно продлевать заметно чаще, чем она истекает, поэтому при аренде список товаров перечитываем чаще.
+    refresh_seconds = min(PRODUCT_REFRESH_SECONDS, LEASE_RENEW_SECONDS) if lease_manager else PRODUCT_REFRESH_SECONDS
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Запускаем адаптивную проверку новых отзывов...")
+
+    next_refresh = 0.0
+    leased_until = 0.0 # До какого момента (по time.monotonic()) действует последняя успешно продленная аренда.
+    try:
+        while True:
+            if time.monotonic() >= next_refresh:
+                try:
+                    # Продлеваем аренду: набор наших шардов мог измениться, если запустились или упали другие процессы.
+                    shards = None
+                    if lease_manager:
+                        renew_started = time.monotonic()
+                        shards = await lease_manager.refresh()
+                        leased_until = renew_started + LEASE_TTL_SECONDS
+                    # Перечитываем список товаров: пользователи могли добавить или удалить товары.
+                    poller.sync_products(await load_products(shards))
+                except Exception as e:
+                    print(f"ERROR_SCHEDULER: Не удалось загрузить список товаров: {e}")
+                    # Аренду продлить не удалось. Пока она не истекла, проверяем прежние товары, но до следующей
+                    # попытки она может истечь, и шарды заберут другие процессы - тогда перестаем их проверять,
+                    # чтобы один товар не проверяли два процесса сразу.
+                    if (lease_manager and lease_manager.shards
+                            and time.monotonic() + refresh_seconds >= leased_until):
+                        print("ERROR_SCHEDULER: Аренда шардов истекает, а продлить ее не удается - "
+                              "перестаем проверять их товары.")
+                        lease_manager.shards = set()
+                        poller.sync_products([])
+                next_refresh = time.monotonic() + refresh_seconds
+                if not len(poller):
+                    print("Нет товаров для мониторинга в базе данных.")
+
+            product = poller.pop_due()
+            if product is not None:
+                # Если все рабочие задачи заняты, ждем, пока какая-нибудь освободится.
+                await _put_job(jobs, product, background)
+                continue
+
+            wait = poller.seconds_until_next()
+            wait = next_refresh - time.monotonic() if wait is None else min(wait, next_refresh - time.monotonic())
+            # Ждем следующего товара, но сразу просыпаемся, если какая-нибудь фоновая задача остановилась.
+            await asyncio.wait(background, timeout=max(wait, 0.05), return_when=asyncio.FIRST_COMPLETED)
+            _check_background_tasks(background)
+    finally:
+        for task in background:
+            task.cancel()
+        if lease_manager:
+            try:
+                await lease_manager.release_all() # Сразу отдаем шарды другим процессам, не дожидаясь истечения аренды.
+            except Exception as e:
+                print(f"ERROR_SCHEDULER: Не удалось освободить аренду шардов: {e}")
+
+
+# Запускает планировщик и перезапускает его через RESTART_DELAY_SECONDS, если он остановился из-за ошибки
+# (см. _check_background_tasks). При перезапуске расписание и аренда шардов создаются заново.
+async def run_scheduler(session: aiohttp.ClientSession, lease_manager: LeaseManager | None = None):
     while True:
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Начинаем проверку новых отзывов...")
-        db: Session = SessionLocal()
         try:
-            # Получаем список всех товаров, которые мы отслеживаем.
-            products = db.execute(select(Product)).scalars().all()
-
-            if not products: # Если товаров нет
-                print("Нет товаров для мониторинга в базе данных.")
-
-            for product in products: # Проходим по каждому товару
-                print(f"Проверяем товар: '{product.name}' (артикул: {product.article})")
-                # Получаем отзывы для этого товара за последние 3 дня.
-                reviews = await get_product_reviews(product.article, days_ago=3)
-
-                if not reviews: # Если нет новых отзывов
-                    print(f"Для товара {product.article} новых негативных отзывов за последние 3 дня не найдено.")
-
-                for review_data in reviews: # Проходим по каждому найденному отзыву
-                    # Проверяем, есть ли такой отзыв уже в нашей базе данных.
-                    existing_review = db.execute(
-                        select(Review).filter_by(external_id=review_data['external_id'])
-                    ).scalar_one_or_none()
-
-                    if not existing_review: # Если отзыв новый
-                        # Создаем новую запись об отзыве.
-                        new_review = Review(
-                            product_id=product.id,
-                            external_id=review_data['external_id'],
-                            rating=review_data['rating'],
-                            text=review_data['text'],
-                            author=review_data['author'],
-                            review_date=review_data['review_date'],
-                            is_notified=False # Помечаем, что уведомление еще не отправлено
-                        )
-                        db.add(new_review)
-                        db.commit()
-                        db.refresh(new_review)
-
-                        # Формируем текст уведомления.
-                        notification_text = (
-                            f"🔴 Новый негативный отзыв!\n"
-                            f"Товар: {product.name}\n"
-                            f"Оценка: {'⭐' * new_review.rating} ({new_review.rating}/5)\n"
-                            f"Отзыв: \"{new_review.text}\"\n"
-                            f"Автор: {new_review.author}\n"
-                            f"Дата отзыва: {new_review.review_date.strftime('%d.%m.%Y %H:%M')}"
-                        )
-
-                        print(f"--- [УВЕДОМЛЕНИЕ] Новый негативный отзыв для '{product.name}' ---")
-                        print(notification_text)
-                        new_review.is_notified = True # Помечаем отзыв как уведомленный.
-                        db.commit()
-                        print(
-                            f"Новый негативный отзыв для {product.name} успешно обработан и отмечен как уведомленный.")
-                    else:
-                        print(
-                            f"DEBUG_SCHEDULER: Отзыв {review_data['external_id']} для {product.name} уже существует в БД.")
-        except Exception as e: # Если произошла ошибка во время проверки
-            print(f"ERROR_SCHEDULER: Произошла ошибка в планировщике проверки отзывов: {e}")
-            db.rollback() # Отменяем все незавершенные изменения в базе данных.
-        finally:
-            db.close() # Всегда закрываем сессию базы данных.
-
-        print(
-            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Завершили проверку. Ожидаем {CHECK_INTERVAL_SECONDS / 60} минут до следующей проверки...")
-        await asyncio.sleep(CHECK_INTERVAL_SECONDS)
\ No newline at end of file
+            await check_for_new_reviews(session, lease_manager=lease_manager)
+        except Exception as e:
+            print(f"ERROR_SCHEDULER: Планировщик остановился из-за ошибки, перезапуск через {RESTART_DELAY_SECONDS} с: {e}")
+        await asyncio.sleep(RESTART_DELAY_SECONDS)
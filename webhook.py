@@ -0,0 +1,69 @@
+import asyncio
+import hashlib
+import logging
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import (
+    BOT_TOKEN, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_LISTEN_HOST, WEBHOOK_LISTEN_PORT, WEBHOOK_SECRET,
+    UPDATE_CONCURRENCY,
+)
+
+logger = logging.getLogger(__name__)
+
+# Режим webhook: Telegram сам присылает обновления HTTP-запросами, бот принимает их локальным aiohttp-сервером.
+# В отличие от опроса (long polling), обновление приходит сразу, без ожидания очередного запроса getUpdates.
+
+
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token. Если WEBHOOK_SECRET не задан, берем хэш от токена:
+# он не меняется между перезапусками, и его не нужно хранить отдельно.
+def _webhook_secret() -> str:
+    return WEBHOOK_SECRET or hashlib.sha256(f"webhook:{BOT_TOKEN}".encode()).hexdigest()
+
+
+# Обработчик запросов Telegram: сразу отвечает Telegram "принято" и обрабатывает обновление в фоне,
+# но не больше UPDATE_CONCURRENCY обновлений одновременно. Когда все места заняты, следующий запрос
+# ждет свободного места, и Telegram сам придерживает новые обновления (как tasks_concurrency_limit при опросе).
+class BoundedRequestHandler(SimpleRequestHandler):
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int = UPDATE_CONCURRENCY, **data):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=_webhook_secret(), **data)
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _background_feed_update(self, bot: Bot, update: dict):
+        try:
+            await super()._background_feed_update(bot, update)
+        finally:
+            self._semaphore.release()
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        await self._semaphore.acquire()
+        try:
+            return await super()._handle_request_background(bot, request)
+        except BaseException:
+            self._semaphore.release() # Задача не создана (например, тело запроса не JSON) - место освобождаем здесь.
+            raise
+
+
+# Сообщает Telegram адрес webhook и секрет при каждом запуске: узнать, какой секрет установлен сейчас, нельзя,
+# а после смены WEBHOOK_SECRET Telegram присылал бы старый, и все обновления отклонялись бы.
+# Повторная установка ничего не сбрасывает: обновления, пришедшие во время перезапуска, Telegram доставит.
+async def ensure_webhook(bot: Bot, allowed_updates: list[str]):
+    url = WEBHOOK_URL + WEBHOOK_PATH
+    await bot.set_webhook(
+        url, secret_token=_webhook_secret(), max_connections=UPDATE_CONCURRENCY,
+        allowed_updates=allowed_updates, drop_pending_updates=False,
+    )
+    logger.info(f"Webhook установлен: {url}")
+
+
+# Запускает HTTP-сервер, который принимает обновления от Telegram по адресу WEBHOOK_PATH.
+# Возвращает runner; сервер останавливается через `await runner.cleanup()`.
+async def start_webhook_server(dispatcher: Dispatcher, bot: Bot) -> web.AppRunner:
+    app = web.Application()
+    BoundedRequestHandler(dispatcher, bot).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dispatcher, bot=bot)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_LISTEN_HOST, WEBHOOK_LISTEN_PORT).start()
+    logger.info(f"Принимаем обновления от Telegram на http://{WEBHOOK_LISTEN_HOST}:{WEBHOOK_LISTEN_PORT}{WEBHOOK_PATH}")
+    return runner
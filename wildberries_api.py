@@ -1,10 +1,24 @@
+import asyncio
 import aiohttp
 import logging
+import itertools
 import json
+import time
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime, timezone
+from cache import TTLCache, MISSING
+from json_stream import iter_array_items
+from host_policy import HostPolicy, RETRYABLE_STATUSES, RetryableStatusError, backoff_delay, parse_retry_after, policy_for
+import metrics
+from config import (
+    WB_PER_HOST_LIMIT, WB_MAX_RETRIES, HTTP_POOL_LIMIT, HTTP_KEEPALIVE_SECONDS, HTTP_DNS_CACHE_SECONDS,
+    HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_TOTAL_TIMEOUT_SECONDS, HTTP_DRAIN_MAX_BYTES,
+    PRODUCT_BATCH_SIZE, PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL_SECONDS, PRODUCT_CACHE_MISS_TTL_SECONDS,
+    DEBUG_PAYLOAD_CHARS, DEBUG_PAYLOAD_SAMPLE_EVERY,
+)
 
-# Настраиваем, как будут выводиться сообщения из этого файла.
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Вывод сообщений настраивает программа, которая использует этот модуль (main.py, worker.py).
+# Сообщения о каждом запросе пишутся на уровне DEBUG и форматируются, только если этот уровень включен.
 logger = logging.getLogger(__name__)
 
 # Адрес API Wildberries для получения информации о товаре.
@@ -15,123 +29,340 @@ WB_API_URL = "https://card.wb.ru/cards/v2/detail?appType=1&curr=rub&dest=-196548
 # К этому адресу тоже будем добавлять артикул.
 WB_REVIEWS_API_URL_BASE = "https://feedbacks2.wb.ru/feedbacks/v2/"
 
+# Размер куска, которым читаем ответ с отзывами при потоковом разборе.
+STREAM_CHUNK_SIZE = 64 * 1024
 
-# Функция для получения названия товара и его артикула с Wildberries.
-async def get_product_info(article: str):
-    full_url = f"{WB_API_URL}{article}" # Собираем полный адрес для запроса.
-    logger.info(f"Запрос информации о продукте: {full_url}")
+# Кэш информации о товарах (артикул -> данные товара или None, если товар не найден).
+_product_cache = TTLCache(maxsize=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL_SECONDS)
+# Запросы информации о товарах, которые выполняются прямо сейчас (артикул -> Future с результатом).
+# Если тот же артикул запрашивают одновременно несколько раз, в API уходит только один запрос.
+_pending_lookups: dict[str, asyncio.Future] = {}
+
+# Счетчик ответов для выборочного вывода их содержимого в лог (см. _debug_payload).
+_payload_counter = itertools.count()
+
+
+# Создает общую HTTP-сессию для всех запросов к Wildberries.
+# Соединения в ней переиспользуются (keep-alive), а DNS-ответы кэшируются,
+# поэтому повторные запросы не тратят время на новое TCP/TLS-соединение.
+# Сессию нужно закрыть через `await session.close()`, когда бот останавливается.
+def create_http_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=WB_PER_HOST_LIMIT,
+        keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+        ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+    )
+    timeout = aiohttp.ClientTimeout(total=HTTP_TOTAL_TIMEOUT_SECONDS, sock_connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+# Выводит в лог начало ответа API, но только если включен уровень DEBUG, и только каждый
+# DEBUG_PAYLOAD_SAMPLE_EVERY-й ответ: большие ответы в логе стоят дороже, чем их разбор.
+def _debug_payload(description: str, body: bytes):
+    if not logger.isEnabledFor(logging.DEBUG) or next(_payload_counter) % DEBUG_PAYLOAD_SAMPLE_EVERY:
+        return
+    text = body[:DEBUG_PAYLOAD_CHARS].decode("utf-8", errors="ignore") # Обрезанный посередине символ отбрасываем.
+    if len(body) > DEBUG_PAYLOAD_CHARS:
+        text += f"... (всего {len(body)} байт)"
+    logger.debug("Получен ответ API %s: %s", description, text)
+
+
+# Одна попытка запроса к Wildberries: ждет свободного места в лимите одновременных запросов к хосту
+# и замеряет длительность запроса, размер ответа и время разбора (время, когда ответ уже получен
+# и его обрабатывает наш код, а не ждем сеть). Ожидание лимита в длительность не входит.
+class _TrackedRequest:
+    def __init__(self, endpoint: str, policy: HostPolicy):
+        self.endpoint = endpoint
+        self.bytes = 0
+        self.parse_seconds = 0.0
+        self._semaphore = policy.semaphore
+        self._chunk_given_at = None # Когда отдали разборщику последний кусок ответа.
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        self._started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+        now = time.perf_counter()
+        if self._chunk_given_at is not None: # Разбор остановился на середине куска (дошли до отметки).
+            self.parse_seconds += now - self._chunk_given_at
+        ok = exc_type is None or issubclass(exc_type, GeneratorExit) # GeneratorExit - перебор прервал вызывающий код.
+        metrics.WB_REQUEST_SECONDS.observe(now - self._started, endpoint=self.endpoint)
+        metrics.WB_REQUESTS.inc(endpoint=self.endpoint, status="ok" if ok else "error")
+        metrics.WB_RESPONSE_BYTES.inc(self.bytes, endpoint=self.endpoint)
+        if self.bytes:
+            metrics.WB_PARSE_SECONDS.observe(self.parse_seconds, endpoint=self.endpoint)
+
+    # Пропускает через себя куски ответа, считая их размер и время, пока каждый кусок разбирается.
+    async def chunks(self, chunks):
+        async for chunk in chunks:
+            self.bytes += len(chunk)
+            self._chunk_given_at = time.perf_counter()
+            yield chunk
+            self.parse_seconds += time.perf_counter() - self._chunk_given_at
+            self._chunk_given_at = None
 
-    async with aiohttp.ClientSession() as session: # Открываем интернет-сессию.
+    # Замеряет разбор уже полностью прочитанного ответа.
+    @contextmanager
+    def parsing(self):
+        started = time.perf_counter()
         try:
-            async with session.get(full_url) as response: # Отправляем запрос.
-                response.raise_for_status() # Проверяем, нет ли ошибок в ответе (например, 404).
-                response_json = await response.json() # Получаем ответ в виде JSON.
-                logger.debug(
-                    f"Получен ответ API для артикула {article}: {json.dumps(response_json, indent=2, ensure_ascii=False)}")
-        except aiohttp.ClientError as e: # Если произошла ошибка сети.
-            logger.error(f"HTTP ошибка при запросе WB API для артикула {article}: {e}")
-            return None
-        except Exception as e: # Если произошла другая, неизвестная ошибка.
-            logger.error(f"Неизвестная ошибка при запросе WB API для артикула {article}: {e}")
-            return None
+            yield
+        finally:
+            self.parse_seconds += time.perf_counter() - started
+
+
+# Отправляет GET-запрос по правилам хоста (см. host_policy.py) и отдает успешный ответ:
+#     async with _get(session, url, "feedbacks") as (request, response): ...
+# Ответы 429 и 5xx, ошибки сети и превышение времени ожидания повторяются до WB_MAX_RETRIES раз
+# с растущей паузой; последняя ошибка передается вызывающему коду. Остальные ошибки (например, 404)
+# не повторяются. Ошибки при чтении уже полученного ответа тоже не повторяются.
+@asynccontextmanager
+async def _get(session: aiohttp.ClientSession, url: str, endpoint: str):
+    policy = policy_for(url)
+    for attempt in range(WB_MAX_RETRIES + 1):
+        await policy.acquire() # Если предохранитель разомкнут, здесь будет CircuitOpenError.
+        received = False # Получен успешный ответ - дальнейшие ошибки уже не повторяем.
+        retry_after = None
+        try:
+            async with _TrackedRequest(endpoint, policy) as request:
+                async with session.get(url) as response:
+                    if response.status in RETRYABLE_STATUSES:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        raise RetryableStatusError(response.status, retry_after)
+                    # Остальные 5xx - неудача хоста. 4xx (например, 404 для удаленного товара) - ошибка запроса,
+                    # а хост работает: для предохранителя это успех, иначе пробный запрос с ответом 404
+                    # оставил бы предохранитель разомкнутым.
+                    if response.status >= 500:
+                        policy.record_failure(response.status)
+                    else:
+                        policy.record_success()
+                    response.raise_for_status()
+                    received = True
+                    yield request, response
+                    return
+        except (RetryableStatusError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if received:
+                raise
+            policy.record_failure(getattr(e, "status", None), retry_after)
+            if attempt == WB_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt, retry_after)
+            logger.debug("Запрос %s не удался (%s), повтор через %.1f с.", url, e, delay)
+        await asyncio.sleep(delay)
+
+
+# Дочитывает непрочитанный остаток ответа, чтобы aiohttp вернул соединение в пул, а не закрыл его.
+# Перебор отзывов обычно останавливается на первых же отзывах (дошли до отметки), и без этого каждая
+# проверка товара открывала бы новое TCP+TLS-соединение. Но дочитывать несколько мегабайт ради одного
+# соединения дороже, чем установить новое, поэтому ответы длиннее HTTP_DRAIN_MAX_BYTES (по Content-Length,
+# а если его нет - по фактически прочитанному) бросаем, и соединение закрывается.
+async def _drain_response(request: _TrackedRequest, response: aiohttp.ClientResponse):
+    if response.content.at_eof():
+        return
+    if response.content_length is not None and response.content_length > HTTP_DRAIN_MAX_BYTES:
+        return
+    drained = 0
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        drained += len(chunk)
+        if drained > HTTP_DRAIN_MAX_BYTES:
+            break
+    request.bytes += drained
+
+
+# Возвращает переданную сессию, а если ее нет - открывает временную только на один запрос.
+@asynccontextmanager
+async def _use_session(session: aiohttp.ClientSession | None):
+    if session is not None:
+        yield session
+    else:
+        async with create_http_session() as own_session:
+            yield own_session
+
+
+# Запрашивает у Wildberries информацию сразу о нескольких товарах одним запросом
+# (артикулы перечисляются в параметре nm через ";"). Возвращает словарь артикул -> информация
+# только для найденных товаров. Ошибки сети не перехватываются.
+async def _fetch_products_batch(articles: list[str], session: aiohttp.ClientSession) -> dict[str, dict]:
+    full_url = f"{WB_API_URL}{';'.join(articles)}" # Собираем полный адрес для запроса.
+    logger.debug("Запрос информации о %d продуктах: %s", len(articles), full_url)
+
+    async with _get(session, full_url, "cards") as (request, response): # Отправляем запрос.
+        body = await response.read()
+        request.bytes = len(body)
+        with request.parsing():
+            response_json = json.loads(body) # Получаем ответ в виде JSON.
+        _debug_payload(f"для {len(articles)} артикулов", body)
+
+    products = {}
+    for product_data in ((response_json or {}).get('data') or {}).get('products') or []:
+        product_name = product_data.get("name") # Получаем название.
+        product_id = product_data.get("id") # Получаем артикул (ID).
+        if product_name and product_id: # Если название и артикул найдены.
+            products[str(product_id)] = {
+                "article": str(product_id),
+                "name": product_name,
+                "brand": product_data.get("brand"),
+            }
+        else: # Если название или артикул не найдены в ответе.
+            logger.debug("Отсутствуют 'name' или 'id' в данных продукта. Product data: %s", product_data)
+    return products
 
+
+# Получает информацию для одной пачки артикулов и раздает ее всем, кто ждет эти артикулы.
+async def _resolve_products_batch(articles: list[str], session: aiohttp.ClientSession):
     try:
-        # Пытаемся найти название и артикул в полученном ответе.
-        if response_json and 'data' in response_json and 'products' in response_json['data'] and response_json['data'][
-            'products']:
-            product_data = response_json['data']['products'][0] # Берем первый найденный товар.
-            logger.debug(f"Получены данные продукта: {product_data}")
-
-            product_name = product_data.get("name") # Получаем название.
-            product_id = product_data.get("id") # Получаем артикул (ID).
-
-            if product_name and product_id: # Если название и артикул найдены.
-                logger.info(f"Найден продукт: '{product_name}' (ID: {product_id})")
-                return { # Возвращаем их.
-                    "article": str(product_id),
-                    "name": product_name,
-                }
-            else: # Если название или артикул не найдены в ответе.
-                logger.debug(
-                    f"Отсутствуют 'name' или 'id' в данных продукта для артикула {article}. Product data: {product_data}")
-                logger.info(f"Не удалось получить информацию о товаре {article} от Wildberries API.")
-                return None
-        else: # Если товар не найден в ответе Wildberries.
-            logger.debug(
-                f"Продукт с артикулом {article} не найден в ответе API (пустая data.products или нет таких ключей).")
-            logger.info(f"Не удалось получить информацию о товаре {article} от Wildberries API.")
-            return None
-    except Exception as e: # Если произошла ошибка при разборе ответа.
-        logger.error(f"Ошибка при парсинге JSON ответа для артикула {article}: {e}")
-        logger.debug(
-            f"Полный ответ API, вызвавший ошибку парсинга: {json.dumps(response_json, indent=2, ensure_ascii=False)}")
+        products = await _fetch_products_batch(articles, session)
+        for article in articles:
+            product_info = products.get(article)
+            if product_info is None:
+                logger.debug("Не удалось получить информацию о товаре %s от Wildberries API.", article)
+                _product_cache.set(article, None, ttl=PRODUCT_CACHE_MISS_TTL_SECONDS)
+            else:
+                logger.debug("Найден продукт: '%s' (ID: %s)", product_info['name'], article)
+                _product_cache.set(article, product_info)
+            _pending_lookups[article].set_result(product_info)
+    except aiohttp.ClientError as e: # Если произошла ошибка сети.
+        logger.error(f"HTTP ошибка при запросе WB API для артикулов {articles}: {e}")
+    except Exception as e: # Если произошла другая, неизвестная ошибка.
+        logger.error(f"Неизвестная ошибка при запросе WB API для артикулов {articles}: {e}")
+    finally:
+        # Ошибки не кэшируем: тем, кто ждал, отдаем None, а следующий запрос снова пойдет в API.
+        for article in articles:
+            future = _pending_lookups.pop(article)
+            if not future.done():
+                future.set_result(None)
+
+
+# Функция для получения названий нескольких товаров с Wildberries.
+# Возвращает словарь артикул -> {"article", "name", "brand"} или None, если товар не найден.
+# Сначала смотрим в кэш, потом присоединяемся к уже идущим запросам тех же артикулов,
+# а оставшиеся артикулы запрашиваем пачками по PRODUCT_BATCH_SIZE штук.
+async def get_products_info(articles: list[str], session: aiohttp.ClientSession | None = None) -> dict[str, dict | None]:
+    result = {}
+    waiting = {} # артикул -> Future с результатом
+    to_fetch = []
+    for article in dict.fromkeys(str(article) for article in articles): # Убираем повторы, сохраняя порядок.
+        cached = _product_cache.get(article)
+        if cached is not MISSING:
+            result[article] = cached
+        elif article in _pending_lookups: # Этот артикул уже запрашивается - просто ждем тот же ответ.
+            waiting[article] = _pending_lookups[article]
+        else:
+            waiting[article] = _pending_lookups[article] = asyncio.get_running_loop().create_future()
+            to_fetch.append(article)
+
+    if to_fetch:
+        async with _use_session(session) as session: # Берем общую интернет-сессию.
+            batches = [to_fetch[i:i + PRODUCT_BATCH_SIZE] for i in range(0, len(to_fetch), PRODUCT_BATCH_SIZE)]
+            await asyncio.gather(*(_resolve_products_batch(batch, session) for batch in batches))
+
+    for article, future in waiting.items():
+        # shield: если нас отменят, общий Future не должен отмениться для остальных ожидающих.
+        result[article] = await asyncio.shield(future)
+    return result
+
+
+# Функция для получения названия товара и его артикула с Wildberries.
+async def get_product_info(article: str, session: aiohttp.ClientSession | None = None):
+    return (await get_products_info([article], session=session)).get(str(article))
+
+
+# Превращает один отзыв из ответа Wildberries в короткую запись, которую мы храним.
+# Возвращает None, если в отзыве нет ни текста, ни оценки.
+def _parse_review(review_data: dict, article: str) -> dict | None:
+    review_date_str = review_data.get('createdDate') # Получаем дату отзыва.
+
+    review_date = datetime.min.replace(tzinfo=timezone.utc) # Дата по умолчанию.
+    if review_date_str:
+        try:
+            # Преобразуем текст даты в правильный формат.
+            review_date = datetime.fromisoformat(review_date_str).replace(tzinfo=timezone.utc)
+        except ValueError: # Если формат даты непонятен.
+            logger.warning("Неизвестный формат даты отзыва '%s' для артикула %s. Используем datetime.min.",
+                           review_date_str, article)
+
+    review_text = review_data.get('text') # Получаем текст отзыва.
+    if not review_text: # Если текста нет, пытаемся собрать его из "плюсов" и "минусов".
+        pros = review_data.get('pros')
+        cons = review_data.get('cons')
+        if pros or cons:
+            review_text = f"Достоинства: {pros}" if pros else ""
+            if cons:
+                review_text += f"\nНедостатки: {cons}" if pros else f"Недостатки: {cons}"
+        else:
+            review_text = "" # Если текста все равно нет.
+
+    if not review_text and review_data.get('productValuation') is None:
         return None
+    return {
+        "external_id": review_data.get('id'),
+        "rating": review_data.get('productValuation'),
+        "text": review_text,
+        "author": (review_data.get('wbUserDetails') or {}).get('name') or "Аноним",
+        "review_date": review_date,
+    }
 
 
-# Функция для получения отзывов о товаре с Wildberries.
-async def get_product_reviews(article: str, last_checked: datetime = None):
+# Потоково получает отзывы о товаре с Wildberries и отдает их по одному, от новых к старым.
+# Ответ разбирается по мере загрузки (см. json_stream.py), поэтому даже для товара с тысячами
+# отзывов в памяти не держится весь ответ целиком.
+# Перебор заканчивается (и остаток ответа не читается), когда:
+#   - встретился отзыв since_id или отзыв старее since (это "отметка" товара, дальше только уже виденные отзывы);
+#   - отдано limit отзывов.
+# Если указан max_rating, отдаются только отзывы с оценкой не выше него (например, 2 - только негативные).
+# Ошибки сети и разбора ответа не перехватываются - их обрабатывает вызывающий код.
+async def iter_product_reviews(article: str, since: datetime = None, since_id: str = None,
+                               max_rating: int = None, limit: int = None,
+                               session: aiohttp.ClientSession | None = None):
     full_url = f"{WB_REVIEWS_API_URL_BASE}{article}" # Собираем полный адрес для запроса.
-    logger.info(f"Запрос отзывов для артикула: {article} по URL: {full_url}")
+    logger.debug("Запрос отзывов для артикула: %s по URL: %s", article, full_url)
 
-    reviews_list = [] # Список для хранения найденных отзывов.
+    if since is not None:
+        since = since.replace(tzinfo=timezone.utc) # В базе дата хранится без часового пояса (в UTC).
 
-    async with aiohttp.ClientSession() as session: # Открываем интернет-сессию.
-        try:
-            async with session.get(full_url) as response: # Отправляем запрос.
-                response.raise_for_status() # Проверяем, нет ли ошибок.
-                reviews_json = await response.json() # Получаем ответ в виде JSON.
-                logger.debug(
-                    f"Получен JSON отзывов для артикула {article}: {json.dumps(reviews_json, indent=2, ensure_ascii=False)}")
-
-                if reviews_json and 'feedbacks' in reviews_json: # Если отзывы найдены.
-                    for review_data in reviews_json['feedbacks']: # Проходим по каждому отзыву.
-                        review_date_str = review_data.get('createdDate') # Получаем дату отзыва.
-
-                        review_date = datetime.min.replace(tzinfo=timezone.utc) # Дата по умолчанию.
-                        if review_date_str:
-                            try:
-                                # Преобразуем текст даты в правильный формат.
-                                review_date = datetime.fromisoformat(review_date_str).replace(tzinfo=timezone.utc)
-                            except ValueError: # Если формат даты непонятен.
-                                logger.warning(
-                                    f"Неизвестный формат даты отзыва '{review_date_str}' для артикула {article}. Используем datetime.min.")
-                                review_date = datetime.min.replace(tzinfo=timezone.utc)
-
-                        # Проверяем, не является ли отзыв старым (если указана дата последней проверки).
-                        if last_checked and review_date <= last_checked.replace(tzinfo=timezone.utc):
-                            logger.debug(
-                                f"Отзыв {review_data.get('id')} от {review_date} старее {last_checked.replace(tzinfo=timezone.utc)}, пропускаем.")
-                            continue # Пропускаем старый отзыв.
-
-                        review_text = review_data.get('text') # Получаем текст отзыва.
-                        if not review_text: # Если текста нет, пытаемся собрать его из "плюсов" и "минусов".
-                            pros = review_data.get('pros')
-                            cons = review_data.get('cons')
-                            if pros or cons:
-                                review_text = f"Достоинства: {pros}" if pros else ""
-                                if cons:
-                                    review_text += f"\nНедостатки: {cons}" if pros else f"Недостатки: {cons}"
-                            else:
-                                review_text = "" # Если текста все равно нет.
-
-                        if review_text or review_data.get('productValuation') is not None: # Если есть текст или оценка.
-                            reviews_list.append({ # Добавляем отзыв в список.
-                                "external_id": review_data.get('id'),
-                                "rating": review_data.get('productValuation'),
-                                "text": review_text,
-                                "author": review_data.get('wbUserDetails', {}).get('name') or "Аноним",
-                                "review_date": review_date,
-                            })
-
-                else: # Если отзывы не найдены или ответ пустой.
-                    logger.debug(
-                        f"Отзывы для артикула {article} не найдены в ответе API или структура JSON изменилась.")
-                    logger.debug(f"Полный ответ API отзывов: {json.dumps(reviews_json, indent=2, ensure_ascii=False)}")
-
-        except aiohttp.ClientError as e: # Если ошибка сети.
-            logger.error(f"HTTP ошибка при запросе WB Reviews API для артикула {article}: {e}")
-        except Exception as e: # Если другая ошибка.
-            logger.error(f"Неизвестная ошибка при запросе WB Reviews API для артикула {article}: {e}")
-
-    logger.info(f"Найдено {len(reviews_list)} новых/обновленных отзывов для артикула {article}.")
-    return reviews_list
\ No newline at end of file
+    yielded = 0
+    async with _use_session(session) as session: # Берем общую интернет-сессию.
+        async with _get(session, full_url, "feedbacks") as (request, response): # Отправляем запрос.
+            chunks = request.chunks(response.content.iter_chunked(STREAM_CHUNK_SIZE))
+            feedbacks = iter_array_items(chunks, "feedbacks")
+            async for review_data in feedbacks: # Проходим по каждому отзыву по мере загрузки.
+                # Дошли до отзыва, который уже видели в прошлый раз, - дальше только более старые.
+                if since_id and str(review_data.get('id')) == since_id:
+                    break
+
+                review = _parse_review(review_data, article)
+                if review is None:
+                    continue
+                date_known = review['review_date'] != datetime.min.replace(tzinfo=timezone.utc)
+                if since and date_known and review['review_date'] < since:
+                    logger.debug("Отзыв %s от %s старее отметки %s, дальше не смотрим.",
+                                 review['external_id'], review['review_date'], since)
+                    break
+                if max_rating is not None and (review['rating'] is None or review['rating'] > max_rating):
+                    continue
+
+                yield review
+                yielded += 1
+                if limit is not None and yielded >= limit:
+                    break
+            await _drain_response(request, response)
+
+
+# Функция для получения отзывов о товаре с Wildberries.
+# Wildberries отдает отзывы от новых к старым, поэтому, если известна "отметка" товара
+# (дата и ID самого нового уже сохраненного отзыва), перебор останавливается, как только
+# мы доходим до уже виденных отзывов.
+# Ошибки (после повторов, см. _get) передаются вызывающему коду: неполный или пустой список вместо
+# ошибки вернуть нельзя, иначе товар будет считаться проверенным, а его "отметка" может сдвинуться
+# дальше непрочитанных отзывов.
+async def get_product_reviews(article: str, since: datetime = None, since_id: str = None,
+                              session: aiohttp.ClientSession | None = None) -> list[dict]:
+    reviews_list = [
+        review async for review in iter_product_reviews(article, since=since, since_id=since_id, session=session)
+    ]
+    logger.debug("Найдено %d новых/обновленных отзывов для артикула %s.", len(reviews_list), article)
+    return reviews_list
@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+
+from config import METRICS_PORT, METRICS_HOST, LOG_LEVEL, WB_HOST_RATE, WB_HOST_MIN_RATE
+from database import init_db, engine
+from leases import LeaseManager
+from metrics import start_metrics_server
+from scheduler import run_scheduler
+from wildberries_api import create_http_session
+
+# Настраиваем, как будут выводиться сообщения о работе планировщика.
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(process)d - %(levelname)s - %(message)s', force=True)
+
+
+# Отдельный процесс-планировщик: проверяет отзывы только для товаров из арендованных шардов.
+# Таких процессов можно запустить несколько (на одной или разных машинах с общей базой данных) -
+# они сами поделят товары между собой. Уведомления отправляет процесс бота (main.py).
+# Если передан metrics_port, метрики процесса отдаются по этому порту.
+async def run_worker(metrics_port: int | None = None):
+    http_session = create_http_session()
+    lease_manager = LeaseManager()
+    metrics_server = await start_metrics_server(metrics_port, METRICS_HOST) if metrics_port else None
+    logging.info(f"Планировщик {lease_manager.owner} запущен.")
+    try:
+        await run_scheduler(http_session, lease_manager=lease_manager)
+    finally:
+        await http_session.close()
+        if metrics_server:
+            await metrics_server.cleanup()
+        await engine.dispose()
+        logging.info(f"Планировщик {lease_manager.owner} остановлен.")
+
+
+# Точка входа одного дочернего процесса.
+def _run_process(metrics_port: int | None = None):
+    try:
+        asyncio.run(run_worker(metrics_port))
+    except KeyboardInterrupt:
+        pass
+
+
+# Готовит базу данных один раз, до запуска процессов-планировщиков.
+async def _prepare_database():
+    await init_db()
+    await engine.dispose() # Соединения родительского процесса дочерним не нужны.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Процесс-планировщик проверки отзывов Wildberries.")
+    parser.add_argument("--processes", type=int, default=1, help="сколько процессов-планировщиков запустить")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="порт для метрик; процессы получают порты подряд, начиная с этого")
+    args = parser.parse_args()
+
+    asyncio.run(_prepare_database())
+    if args.processes <= 1:
+        _run_process(args.metrics_port)
+        return
+
+    # Ограничения скорости запросов к Wildberries действуют внутри процесса - делим их между процессами,
+    # чтобы вместе они не отправляли в N раз больше. Дочерние процессы читают настройки из окружения заново.
+    os.environ["WB_HOST_RATE"] = str(WB_HOST_RATE / args.processes)
+    os.environ["WB_HOST_MIN_RATE"] = str(WB_HOST_MIN_RATE / args.processes)
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_run_process, args=(args.metrics_port + index if args.metrics_port else None,))
+        for index in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Ctrl+C получают и дочерние процессы: ждем, пока они отпустят аренду и завершатся.
+        for process in processes:
+            process.join()
+    logging.info("Все планировщики остановлены.")
+
+
+if __name__ == "__main__":
+    main()